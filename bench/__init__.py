@@ -0,0 +1,16 @@
+# coding=utf-8
+"""
+micro benchmarks, 以模块方式运行, 如:
+python -m pytoolbox.bench.endpoints
+"""
+from __future__ import print_function, unicode_literals
+
+import timeit
+
+
+def bench(label, func, number=10000, repeat=3):
+    """ 打印func每次调用的最好耗时(微秒)和每秒调用次数, 并返回耗时
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+    print('{0:<48} {1:>12.2f} us/call {2:>12.0f} ops/s'.format(label, best, 1e6 / best if best else 0))
+    return best
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+比较aes补位/去补位和解密的耗时:
+python -m pytoolbox.bench.aes
+"""
+from __future__ import print_function, unicode_literals
+
+import base64
+import os
+from multiprocessing import Pool
+
+from Crypto.Cipher import AES
+
+from . import bench
+from ..util import aes
+
+KEY = b'0123456789abcdef'
+
+
+def _legacy_depkcs7_padding(data, size=16):
+    newdata = data[:-size]
+    for c in data[-size:]:
+        if ord(c) > size:
+            newdata += c
+    return newdata
+
+
+def _legacy_decrypt_from_base64(data, key):
+    cipher = AES.new(key[:16])
+    return _legacy_depkcs7_padding(cipher.decrypt(base64.b64decode(data))).decode('utf8')
+
+
+def bench_padding():
+    for size in (1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024):
+        text = base64.b64encode(os.urandom(size * 3 // 4))
+        encrypted = aes.encrypt_to_base64(text.decode('ascii'), KEY)
+        ciphertext = base64.b64decode(encrypted)
+        decrypted = AES.new(KEY).decrypt(ciphertext)
+        number = max(3, 10 * 1024 * 1024 // size)
+        label = '{0}KB'.format(size // 1024)
+        bench('legacy depkcs7_padding, ' + label, lambda: _legacy_depkcs7_padding(decrypted), number=number)
+        bench('depkcs7_padding, ' + label, lambda: aes.__depkcs7_padding(decrypted),
+              number=number)
+        bench('legacy decrypt_from_base64, ' + label, lambda: _legacy_decrypt_from_base64(encrypted, KEY),
+              number=number)
+        bench('decrypt_from_base64, ' + label, lambda: aes.decrypt_from_base64(encrypted, KEY), number=number)
+        bench('decrypt(bytes), ' + label, lambda: aes.decrypt(ciphertext, KEY), number=number)
+
+
+def bench_ciphers():
+    message = '{"amount": "1.00", "order_id": "20160101000000000001", "user_id": 1234567}'
+    bench('encrypt_to_base64 (new cipher per call)', lambda: aes.encrypt_to_base64(message, KEY), number=50000)
+    encrypted = aes.encrypt_to_base64(message, KEY)
+    bench('decrypt_from_base64 (new cipher per call)', lambda: aes.decrypt_from_base64(encrypted, KEY),
+          number=50000)
+    modes = [aes.Mode.ECB, aes.Mode.CBC, aes.Mode.CTR]
+    if aes._has_gcm():
+        modes.append(aes.Mode.GCM)
+    for mode in modes:
+        cipher = aes.AESCipher(KEY, mode)
+        encrypted = cipher.encrypt_to_base64(message)
+        bench('AESCipher({0}).encrypt_to_base64'.format(mode), lambda: cipher.encrypt_to_base64(message),
+              number=50000)
+        bench('AESCipher({0}).decrypt_from_base64'.format(mode), lambda: cipher.decrypt_from_base64(encrypted),
+              number=50000)
+
+
+def bench_records(count=20000):
+    records = [{'id': i, 'amount': '1.00', 'order_id': '{0:020d}'.format(i), 'state': 'SUCCESS'}
+               for i in range(count)]
+    bench('encrypt_data x {0}'.format(count), lambda: [aes.encrypt_data(r, KEY) for r in records], number=1,
+          repeat=3)
+    bench('encrypt_many x {0}'.format(count), lambda: list(aes.encrypt_many(records, KEY)), number=1, repeat=3)
+    pool = Pool()
+    try:
+        bench('encrypt_many(pool) x {0}'.format(count), lambda: list(aes.encrypt_many(records, KEY, pool=pool)),
+              number=1, repeat=3)
+        encrypted = list(aes.encrypt_many(records, KEY))
+        bench('decrypt_data x {0}'.format(count), lambda: [aes.decrypt_data(e, KEY) for e in encrypted], number=1,
+              repeat=3)
+        bench('decrypt_many x {0}'.format(count), lambda: list(aes.decrypt_many(encrypted, KEY)), number=1,
+              repeat=3)
+        bench('decrypt_many(pool) x {0}'.format(count), lambda: list(aes.decrypt_many(encrypted, KEY, pool=pool)),
+              number=1, repeat=3)
+    finally:
+        pool.close()
+
+
+def main():
+    bench_padding()
+    bench_ciphers()
+    bench_records()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# coding=utf-8
+from __future__ import print_function, unicode_literals
+
+import hashlib
+
+from . import bench
+from ..util import digest
+
+
+def _legacy_hmac_sign(avalue, akey, encode="UTF-8"):
+    keyb = akey.encode(encode)
+    value = avalue.encode(encode)
+
+    k_ipad = [chr(54)] * 64
+    k_opad = [chr(92)] * 64
+    for i, c in enumerate(keyb):
+        k_ipad[i] = chr(ord(c) ^ 0x36)
+        k_opad[i] = chr(ord(c) ^ 0x5c)
+    k_ipad = ''.join(k_ipad)
+    k_opad = ''.join(k_opad)
+
+    md = hashlib.md5()
+
+    md.update(k_ipad)
+    md.update(value)
+    dg = md.digest()
+
+    md = hashlib.md5()
+    md.update(k_opad)
+    md.update(dg[:16])
+
+    return md.hexdigest()
+
+
+def main():
+    key = 'a3f0c1d2e5b64798a3f0c1d2e5b64798'
+    message = 'amount=1.00&order_id=20160101000000000001&user_id=1234567'
+    assert digest.hmac_sign(message, key) == _legacy_hmac_sign(message, key)
+    bench('legacy hmac_sign', lambda: _legacy_hmac_sign(message, key), number=20000)
+    bench('hmac_sign', lambda: digest.hmac_sign(message, key), number=20000)
+
+    messages = ['{0}&n={1}'.format(message, i) for i in range(1000)]
+    assert digest.hmac_sign_many(messages, key) == [_legacy_hmac_sign(m, key) for m in messages]
+    bench('legacy hmac_sign x 1000', lambda: [_legacy_hmac_sign(m, key) for m in messages], number=20)
+    bench('hmac_sign_many x 1000', lambda: digest.hmac_sign_many(messages, key), number=20)
+
+    parts = [message] * 10000
+    bench('legacy hmac_sign(join) 10000 parts', lambda: _legacy_hmac_sign(''.join(parts), key), number=20)
+    bench('HMAC.update_from 10000 parts', lambda: digest.HMAC(key).update_from(parts).hexdigest(), number=20)
+
+
+if __name__ == '__main__':
+    main()
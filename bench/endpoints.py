@@ -0,0 +1,32 @@
+# coding=utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+
+from . import bench
+from ..pay_client.config import Config
+from ..pay_client.endpoints import UrlTemplate, append_query
+from ..util.urls import build_url
+
+
+def _legacy_generate_api_url(url, **kwargs):
+    url = url.lstrip('/')
+    return os.path.join(Config.ROOT_URL, url.format(**kwargs))
+
+
+def main():
+    balance = UrlTemplate(Config.ROOT_URL, Config.APP_QUERY_USER_BALANCE_URL)
+    bench('legacy _generate_api_url', lambda: _legacy_generate_api_url(Config.APP_QUERY_USER_BALANCE_URL,
+                                                                        user_id='1234567'))
+    bench('UrlTemplate.format', lambda: balance.format(user_id='1234567'))
+
+    transactions = UrlTemplate(Config.ROOT_URL, Config.LIST_USER_TRANSACTIONS_URL)
+    params = {'role': 'payer', 'page_no': 3, 'page_size': 20, 'vas_name': 'ZYT'}
+    bench('legacy list_transactions url', lambda: build_url(
+        _legacy_generate_api_url(Config.LIST_USER_TRANSACTIONS_URL, user_id='1234567'), **params))
+    bench('UrlTemplate.format + append_query', lambda: append_query(
+        transactions.format(user_id='1234567'), params))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""
+用本地的StubPayServer压测PayClient:
+python -m pytoolbox.bench.pay_client --calls 2000 --concurrency 32 --latency 0.005
+stub服务默认运行在单独的进程中, 不与被测的client争用GIL; --stub-in-thread在当前进程中运行
+
+sync: 每次调用新建连接(关闭keep-alive)
+pooled: 单线程复用连接池
+concurrent: AsyncPayClient并发调用
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import logging
+from timeit import default_timer as timer
+
+from .. import pay_client
+from ..pay_client import PayClient
+from ..pay_client.async_client import AsyncPayClient
+from ..pay_client.stub_server import StubPayServer
+from ..util import public_key
+
+
+def _env_config(root_url, keep_alive=True, pool_maxsize=10):
+    class EnvConfig:
+        CHANNEL_PRI_KEY = public_key.generate_key(1024).b64encoded_binary_key_data()
+        ROOT_URL = root_url
+        HTTP_KEEP_ALIVE = keep_alive
+        HTTP_POOL_MAXSIZE = pool_maxsize
+        REQUEST_MAX_RETRIES = 0
+    return EnvConfig
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def _report(mode, latencies, elapsed):
+    latencies = sorted(latencies)
+    print('{0:<12} {1:>8} calls {2:>10.1f} calls/s   p50 {3:>8.2f} ms   p99 {4:>8.2f} ms'.format(
+        mode, len(latencies), len(latencies) / elapsed, _percentile(latencies, 0.5) * 1000,
+        _percentile(latencies, 0.99) * 1000))
+
+
+def _timed(func, *args):
+    start = timer()
+    func(*args)
+    return timer() - start
+
+
+def run_serial(mode, client, calls):
+    try:
+        start = timer()
+        latencies = [_timed(client.app_query_user_balance, 'user{0}'.format(i)) for i in range(calls)]
+        _report(mode, latencies, timer() - start)
+    finally:
+        client.close()
+
+
+def run_concurrent(client, calls, concurrency):
+    async_client = AsyncPayClient(client=client, max_concurrency=concurrency)
+    try:
+        start = timer()
+        pending = [async_client.submit(_timed, client.app_query_user_balance, 'user{0}'.format(i))
+                   for i in range(calls)]
+        latencies = [p.get() for p in pending]
+        _report('concurrent', latencies, timer() - start)
+    finally:
+        async_client.close()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PayClient benchmark against a local stub pay server.')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0, help='stub server latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--stub-in-thread', action='store_true',
+                        help='run the stub server in this process instead of a separate one')
+    args = parser.parse_args()
+
+    for name in list(logging.Logger.manager.loggerDict):
+        if name.startswith(pay_client.__name__):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    server = StubPayServer(latency=args.latency, error_rate=args.error_rate).start(process=not args.stub_in_thread)
+    try:
+        run_serial('sync', PayClient(_env_config(server.root_url, keep_alive=False)), args.calls)
+        run_serial('pooled', PayClient(_env_config(server.root_url)), args.calls)
+        run_concurrent(PayClient(_env_config(server.root_url, pool_maxsize=args.concurrency)), args.calls,
+                       args.concurrency)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# coding=utf-8
+"""
+比较rsa_backends中各实现的RSA性能:
+python -m pytoolbox.bench.public_key
+"""
+from __future__ import print_function, unicode_literals
+
+from . import bench
+from ..util import public_key, rsa_backends
+
+
+def main():
+    data = b'amount=1.00&channel_name=lvye_pay_test&order_id=20160101000000000001&user_id=1234567'
+    for bits in (1024, 2048, 4096):
+        key_data = public_key.generate_key(bits, rsa_backends.DEFAULT_BACKEND).key_data('DER', pkcs=8)
+        for name in sorted(rsa_backends.BACKENDS):
+            key = public_key.loads_key(key_data, name)
+            pub_key = key.gen_public_key()
+            signature = key.sign_md5(data)
+            ciphertext = pub_key.encrypt(data[:32])
+            number = 20 if bits == 4096 else 100
+            for op, func in (('sign_md5', lambda: key.sign_md5(data)),
+                             ('verify_md5', lambda: pub_key.verify_md5(data, signature)),
+                             ('encrypt', lambda: pub_key.encrypt(data[:32])),
+                             ('decrypt', lambda: key.decrypt(ciphertext))):
+                bench('{0} {1} {2}'.format(name, bits, op), func, number=number)
+
+
+if __name__ == '__main__':
+    main()
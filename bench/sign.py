@@ -0,0 +1,41 @@
+# coding=utf-8
+from __future__ import print_function, unicode_literals
+
+from . import bench
+from ..util.sign import Signer
+
+
+def _legacy_gen_sign_data(signer, data):
+    keys = data.keys()
+    if signer.ignore_case:
+        keys.sort(key=lambda x: x.lower())
+    else:
+        keys.sort()
+
+    def is_valid_item(k, v):
+        return k and k not in signer.ignore_keys and (k in signer.include_keys or k[0] != '_') \
+               and v is not None and v != '' and not isinstance(v, (dict, list))
+    return '&'.join(['%s=%s' % (k, data[k]) for k in keys if is_valid_item(k, data[k])])
+
+
+def _payload(size):
+    data = {'sign': 'x' * 172, '_lvye_pub_key': 'k', 'extra': {}}
+    for i in range(size):
+        data['Field{0:03d}'.format(i)] = 'value{0}'.format(i) if i % 7 else ''
+    return data
+
+
+def main():
+    signer = Signer('key', 'sign')
+    for size in (10, 50, 100, 500):
+        data = _payload(size)
+        assert signer._gen_sign_data(data) == _legacy_gen_sign_data(signer, data)
+        number = max(200, 50000 // size)
+        bench('legacy _gen_sign_data, {0} fields'.format(size), lambda: _legacy_gen_sign_data(signer, data),
+              number=number)
+        bench('Canonicalizer, {0} fields'.format(size), lambda: signer.canonicalizer.canonicalize(data),
+              number=number)
+
+
+if __name__ == '__main__':
+    main()
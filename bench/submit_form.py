@@ -0,0 +1,40 @@
+# coding=utf-8
+from __future__ import print_function, unicode_literals
+
+from . import bench
+from ..pay_client.utils import iter_submit_form, submit_form
+
+
+def _legacy_submit_form(url, req_params, method='POST'):
+    submit_page = '<form id="formName" action="{0}" method="{1}">'.format(url, method)
+    for key in req_params:
+        submit_page += '''<input type="hidden" name="{0}" value='{1}' />'''.format(key, req_params[key])
+    submit_page += '<input type="submit" value="Submit" style="display:none" /></form>'
+    submit_page += '<script>document.forms["formName"].submit();</script>'
+    return submit_page
+
+
+def main():
+    url = 'http://pay.lvye.com/api/__/biz_payment/callback'
+    # web_payment_callback的表单有5个参数
+    for size in (2, 5, 10, 50, 200):
+        # 一般参数不需转义, 每10个中有一个需转义
+        params = dict(('field{0}'.format(i), '{0:020d}'.format(i) if i % 10 else 'a "quoted" <value> & {0}'.format(i))
+                      for i in range(size))
+        number = max(1000, 100000 // size)
+        bench('legacy submit_form, {0} fields'.format(size), lambda: _legacy_submit_form(url, params),
+              number=number)
+        bench('submit_form, {0} fields'.format(size), lambda: submit_form(url, params), number=number)
+        bench('iter_submit_form, {0} fields'.format(size), lambda: ''.join(iter_submit_form(url, params)),
+              number=number)
+
+    # 与web_payment_callback相同的参数, 都不需转义
+    params = {'sn': '{0:032x}'.format(1), 'result': 'SUCCESS', 'channel_name': 'lvye_pay_test', 'sign_type': 'RSA',
+              'sign': 'Jx9/5k+vQm3' * 15 + '=='}
+    bench('legacy submit_form, callback', lambda: _legacy_submit_form(url, params), number=100000)
+    bench('submit_form, callback', lambda: submit_form(url, params), number=100000)
+    bench('iter_submit_form, callback', lambda: ''.join(iter_submit_form(url, params)), number=100000)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,31 @@ from __future__ import unicode_literals
 from collections import namedtuple
 from decimal import Decimal
 from functools import wraps
+from hashlib import sha1
+from multiprocessing.pool import Pool, ThreadPool
+from timeit import default_timer as timer
 
-import os
-import requests
+import logging
+import threading
+import time
 from . import constant
-from .utils import is_success_result, submit_form, which_to_return
+from .utils import is_success_result, iter_submit_form, submit_form, which_to_return
+from .batch import Batch, collect_results, normalize_calls, run_call
+from .channels import ChannelRegistry
 from .config import Config
+from .decoding import ResponseError, iter_items, loads
+from .endpoints import UrlTemplate, append_query, compile_endpoints
+from .idempotency import SingleFlight, idempotent
+from .metrics import Instrumentation, VERIFY_ENDPOINT, elapsed_ms
+from .pagination import iter_pages, page_items
+from .policy import DEFAULT_ENDPOINT, RequestPolicies
+from .session import HttpSession
+from .verification import make_rsa_task, verify_rsa_task
 from ..util import pmc_config, public_key, aes
+from ..util.cache import LRUCache, MISSING
 from ..util.log import get_logger
-from ..util.sign import SignType, Signer
-from ..util.urls import build_url, extract_query_params
+from ..util.sign import SignCache, SignType, Signer
+from ..util.urls import extract_query_params
 
 logger = get_logger(__name__)
 Result = namedtuple('Result', 'status_code, data')
@@ -22,12 +37,21 @@ Result = namedtuple('Result', 'status_code, data')
 class PayClient(object):
     constant = constant
 
-    def __init__(self, env_config=None):
+    def __init__(self, env_config=None, shared=None):
+        """
+        :param env_config: 覆盖Config的配置
+        :param shared: 与此client共用连接池、缓存和统计, 用于同一进程中的多个渠道
+        """
         self.config = Config()
         self.signer = Signer('key', 'sign')
         self.channel_pri_key = None
-        self._uid_accounts = {}
-        self._accepted_channel_clients = {}
+        self.session = None
+        self.channels = ChannelRegistry(self)
+        self._shared = shared
+        self._worker_pool = None
+        self._verify_pool = None
+        self._worker_pool_lock = threading.Lock()
+        self._init_resources()
 
         if env_config is not None:
             self.init_config(env_config)
@@ -37,18 +61,68 @@ class PayClient(object):
         # 这里的主要作用是签名, 只需要channel_pri_key或md5_key
         self.signer.init(self.config.MD5_KEY, self.config.CHANNEL_PRI_KEY, None)
         self.channel_pri_key = public_key.loads_b64encoded_key(self.config.CHANNEL_PRI_KEY)
+        self._init_resources()
+
+    def _init_resources(self):
+        self.endpoints = compile_endpoints(self.config)
+        self.channels.max_loaded = self.config.CHANNEL_MAX_LOADED
+        self.channels.max_idle = self.config.CHANNEL_MAX_IDLE
+
+        shared = self._shared
+        if shared is not None:
+            self.session = shared.session
+            self.policies = shared.policies
+            self.metrics = shared.metrics
+            self.signer.sign_cache = shared.signer.sign_cache
+            self.account_user_cache = shared.account_user_cache
+            self.verify_signer_cache = shared.verify_signer_cache
+            self.single_flight = shared.single_flight
+            return
+
+        if self.session is not None:
+            self.session.close()
+        self.session = HttpSession.from_config(self.config)
+        self.policies = RequestPolicies(self.config)
+        self.metrics = Instrumentation.from_config(self.config)
+        self.signer.sign_cache = self._new_sign_cache()
+        self.account_user_cache = self._new_account_user_cache()
+        self.verify_signer_cache = self._new_verify_signer_cache()
+        self.single_flight = SingleFlight(self.config.IDEMPOTENCY_WINDOW, self.config.IDEMPOTENCY_CACHE_SIZE)
+
+    def _new_sign_cache(self):
+        return SignCache(self.config.SIGN_CACHE_SIZE, self.config.SIGN_CACHE_TTL)
+
+    def sign_cache_stats(self):
+        return self.signer.sign_cache.stats()
+
+    def _new_account_user_cache(self):
+        return LRUCache(self.config.ACCOUNT_USER_CACHE_SIZE, self.config.ACCOUNT_USER_CACHE_TTL)
+
+    def _new_verify_signer_cache(self):
+        return LRUCache(self.config.VERIFY_KEY_CACHE_SIZE, self.config.VERIFY_KEY_CACHE_TTL)
+
+    def set_account_user_cache(self, cache):
+        """ 替换user_id => account_user_id缓存, 如使用SharedCache在多个进程间共享
+        需在init_config之后调用
+        """
+        self.account_user_cache = cache
 
     def setup_accepted_clients(self, clients):
         for client in clients:
-            self._accepted_channel_clients[client.config.CHANNEL_NAME] = client
+            self.channels.add_client(client)
+
+    def register_accepted_channels(self, env_configs):
+        """ 注册接受的渠道, 首次收到该渠道的请求时才加载其私钥, 并与此client共用连接池和缓存
+        """
+        for env_config in env_configs:
+            self.channels.register(env_config)
 
     def _get_current_client(self, channel_name):
-        client = self
-        if self._accepted_channel_clients:
-            client = self._accepted_channel_clients.get(channel_name)
-        if channel_name != client.config.CHANNEL_NAME:
+        if len(self.channels):
+            return self.channels.get(channel_name)
+        if channel_name != self.config.CHANNEL_NAME:
             return None
-        return client
+        return self
 
     def _do_verify_request(self, method, url, data):
         try:
@@ -61,12 +135,12 @@ class PayClient(object):
                 is_verify_pass = False
             else:
                 # verify sign
-                lvye_aes_key = client.channel_pri_key.decrypt_from_base64(data['_lvye_aes_key'])
-                lvye_pub_key = aes.decrypt_from_base64(data['_lvye_pub_key'], lvye_aes_key)
-                # 主要用来验签
-                signer = Signer('key', 'sign', client.config.MD5_KEY, None, lvye_pub_key)
+                start = timer() if self.metrics.enabled else None
+                signer = client._get_verify_signer(data['_lvye_aes_key'], data['_lvye_pub_key'])
                 sign_type = data['sign_type']
                 is_verify_pass = signer.verify(data, sign_type)
+                if start is not None:
+                    self.metrics.timing(VERIFY_ENDPOINT, 'verify_ms', elapsed_ms(start))
         except Exception as e:
             logger.exception(e)
             is_verify_pass = False
@@ -74,6 +148,74 @@ class PayClient(object):
         logger.info("[{0}] verify done.".format(url))
         return is_verify_pass
 
+    def _get_verify_signer(self, encrypted_aes_key, encrypted_pub_key):
+        """ 解密对方传来的公钥并生成验签用的Signer
+        相同的密文会得到相同的公钥, 以密文摘要为key缓存, 避免每次私钥解密和解析公钥
+        """
+        key = sha1('{0}|{1}|{2}'.format(self.config.CHANNEL_NAME, encrypted_aes_key,
+                                        encrypted_pub_key).encode('utf-8')).hexdigest()
+        signer = self.verify_signer_cache.get(key)
+        if signer is None:
+            lvye_aes_key = self.channel_pri_key.decrypt_from_base64(encrypted_aes_key)
+            lvye_pub_key = aes.decrypt_from_base64(encrypted_pub_key, lvye_aes_key)
+            # 主要用来验签
+            signer = Signer('key', 'sign', self.config.MD5_KEY, None, lvye_pub_key)
+            self.verify_signer_cache.set(key, signer)
+        return signer
+
+    def verify_many(self, requests):
+        """ 批量验签, 如支付服务重放积压的通知时
+        按渠道分组并复用解密的公钥, 签名串在当前进程生成, RSA验签分发到进程池
+        :param requests: data的iterable, 与verify_request中的params相同
+        :return: 与requests顺序一致的[is_verify_pass, ...]
+        """
+        start = timer() if self.metrics.enabled else None
+        requests = list(requests)
+        verdicts = [False] * len(requests)
+        clients = {}
+        indexes, tasks = [], []
+        for i, data in enumerate(requests):
+            try:
+                channel_name = data.get('channel_name')
+                if channel_name not in clients:
+                    clients[channel_name] = self._get_current_client(channel_name)
+                client = clients[channel_name]
+                if client is None or channel_name != client.config.CHANNEL_NAME:
+                    continue
+                signer = client._get_verify_signer(data['_lvye_aes_key'], data['_lvye_pub_key'])
+                task = make_rsa_task(signer, data)
+                if task is None:
+                    verdicts[i] = signer.verify(data, data['sign_type'])
+                else:
+                    indexes.append(i)
+                    tasks.append(task)
+            except Exception as e:
+                logger.exception(e)
+
+        pool = self._get_verify_pool() if len(tasks) >= self.config.VERIFY_MIN_PARALLEL else None
+        if pool is None:
+            results = [verify_rsa_task(task) for task in tasks]
+        else:
+            results = pool.map(verify_rsa_task, tasks)
+        for i, is_verify_pass in zip(indexes, results):
+            verdicts[i] = is_verify_pass
+
+        if start is not None:
+            self.metrics.timing(VERIFY_ENDPOINT, 'verify_many_ms', elapsed_ms(start))
+        logger.info("verify many done: [{0}/{1}] passed.".format(sum(verdicts), len(verdicts)))
+        return verdicts
+
+    def _get_verify_pool(self):
+        if self._shared is not None:
+            return self._shared._get_verify_pool()
+        if self.config.VERIFY_PROCESSES == 0:
+            return None
+        if self._verify_pool is None:
+            with self._worker_pool_lock:
+                if self._verify_pool is None:
+                    self._verify_pool = Pool(self.config.VERIFY_PROCESSES)
+        return self._verify_pool
+
     def verify_request_generic(self, get_ctx, set_ctx=None, fail_verify_handler=None):
         def verify_request(f):
             @wraps(f)
@@ -111,8 +253,10 @@ class PayClient(object):
         return self.verify_request_generic(get_ctx, set_ctx)(f)
 
     def _generate_api_url(self, url, **kwargs):
-        url = url.lstrip('/')
-        return os.path.join(self.config.ROOT_URL, url.format(**kwargs))
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            endpoint = self.endpoints[url] = UrlTemplate(self.config.ROOT_URL, url)
+        return endpoint.format(**kwargs)
 
     def _add_sign_to_params(self, params, sign_type=SignType.RSA):
         params['sign_type'] = sign_type
@@ -125,34 +269,174 @@ class PayClient(object):
     def is_success_result(result):
         return is_success_result(result)
 
+    def http_pool_stats(self):
+        return self.session.stats()
+
     @staticmethod
-    def _do_request(url, params=None, method='get'):
-        try:
-            logger.info("request {0} {1}: {2}".format(method, url, params))
-            req = requests.request(method, url, data=params)
+    def _endpoint_of(url):
+        return getattr(url, 'template', None) or DEFAULT_ENDPOINT
+
+    def _do_request(self, url, params=None, method='get'):
+        endpoint = self._endpoint_of(url)
+        metrics = self.metrics if self.metrics.enabled else None
+        policy = self.policies.get(endpoint)
+        breaker = self.policies.breaker(endpoint)
+
+        deadline = time.time() + policy.deadline if policy.deadline is not None else None
+        attempts = policy.attempts(method)
+        req = None
+        for attempt in range(attempts):
+            if attempt > 0:
+                if metrics is not None:
+                    metrics.incr(endpoint, 'retries')
+                delay = policy.backoff(attempt - 1)
+                if deadline is not None:
+                    delay = min(delay, deadline - time.time())
+                if delay > 0:
+                    time.sleep(delay)
+
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                logger.warn("request deadline exceeded: {0} {1}".format(method, url))
+                break
+            if not breaker.allow():
+                logger.warn("circuit open, reject request: {0} {1}".format(method, url))
+                if metrics is not None:
+                    metrics.incr(endpoint, 'rejected')
+                break
+
+            start = timer() if metrics is not None else None
             try:
-                if req.status_code != 200:
-                    logger.warn('failed request result: [{0}], [{1}]'.format(req.status_code, req.text))
-                logger.debug('request result: [{0}], [{1}]'.format(req.status_code, req.text))
-                return Result(req.status_code, req.json(use_decimal=True))
+                logger.info("request {0} {1}: {2}".format(method, url, params))
+                req = self.session.request(method, url, data=params, timeout=policy.timeout(remaining))
             except Exception as e:
                 logger.exception(e)
-                return None
+                breaker.record_failure()
+                if metrics is not None:
+                    metrics.timing(endpoint, 'request_ms', elapsed_ms(start))
+                    metrics.incr(endpoint, 'errors')
+                continue
+
+            if metrics is not None:
+                self._record_response(metrics, endpoint, req, start)
+
+            if req.status_code < 500:
+                breaker.record_success()
+                break
+            breaker.record_failure()
+
+        if req is None:
+            return None
+        return self._parse_response(req)
+
+    @staticmethod
+    def _record_response(metrics, endpoint, req, start):
+        metrics.timing(endpoint, 'request_ms', elapsed_ms(start))
+        metrics.incr(endpoint, 'status.{0}'.format(req.status_code))
+        metrics.histogram(endpoint, 'request_bytes', len(req.request.body or b''))
+        metrics.histogram(endpoint, 'response_bytes', len(req.content))
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot()
+
+    @staticmethod
+    def _parse_response(req):
+        try:
+            body = req.content
+            if req.status_code != 200:
+                logger.warn('failed request result: [{0}], [{1}]'.format(req.status_code, req.text))
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug('request result: [{0}], [{1}]'.format(req.status_code, req.text))
+            return Result(req.status_code, loads(body))
         except Exception as e:
             logger.exception(e)
-        return None
+            return None
+
+    def request_policy_stats(self):
+        return self.policies.stats()
+
+    def _get_worker_pool(self):
+        if self._shared is not None:
+            return self._shared._get_worker_pool()
+        if self._worker_pool is None:
+            with self._worker_pool_lock:
+                if self._worker_pool is None:
+                    self._worker_pool = ThreadPool(self.config.BATCH_MAX_WORKERS)
+        return self._worker_pool
+
+    def close(self):
+        """ 关闭此client创建的验签进程池、batch/gather线程池和连接池
+        与shared共用的资源由shared关闭
+        """
+        if self._shared is not None:
+            return
+        with self._worker_pool_lock:
+            pools, self._verify_pool, self._worker_pool = (self._verify_pool, self._worker_pool), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self.session.close()
+
+    def batch(self):
+        return Batch(self)
+
+    def gather(self, calls, timeout=None):
+        """ 并发执行多个api调用
+        :param calls: [(method, args[, kwargs]), ...], 如('app_query_user_balance', (user_id,))
+        :param timeout: 等待全部调用的总超时(秒), 届时未完成的调用结果为CallResult(None, CallTimeoutError)
+        :return: 与calls顺序一致的[CallResult(value, error), ...]
+        """
+        calls = normalize_calls(calls)
+        if not calls:
+            return []
+        if len(calls) == 1 and timeout is None:
+            # 不需要超时的单个调用直接在当前线程执行
+            return [run_call(self, *calls[0])]
+
+        pool = self._get_worker_pool()
+        pending = [pool.apply_async(run_call, (self,) + call) for call in calls]
+        return collect_results(calls, pending, timeout)
 
     def request(self, url, params=None, sign_type=SignType.RSA, method='post'):
         if params is None:
             params = {}
 
         params.update(extract_query_params(url))
-        params = self._add_sign_to_params(params, sign_type)
+        if self.metrics.enabled:
+            start = timer()
+            params = self._add_sign_to_params(params, sign_type)
+            self.metrics.timing(self._endpoint_of(url), 'sign_ms', elapsed_ms(start))
+        else:
+            params = self._add_sign_to_params(params, sign_type)
 
         return self._do_request(url, params, method=method)
 
+    def stream_items(self, url, params=None, prefix='data.item', sign_type=SignType.RSA, method='get'):
+        """ 以流的方式请求, 边接收边解析, 逐个返回响应中prefix处数组的元素, 适用于很大的列表
+        请求失败时抛出ResponseError, 不做重试
+        :param prefix: ijson的prefix格式, 如 data.item 表示 result.data['data'] 中的元素
+        """
+        if params is None:
+            params = {}
+
+        params.update(extract_query_params(url))
+        params = self._add_sign_to_params(params, sign_type)
+        policy = self.policies.get(self._endpoint_of(url))
+
+        logger.info("stream request {0} {1}: {2}".format(method, url, params))
+        req = self.session.request(method, url, data=params, stream=True, timeout=policy.timeout())
+        try:
+            if req.status_code != 200:
+                raise ResponseError(req.status_code, req.text)
+            req.raw.decode_content = True
+            for item in iter_items(req.raw, prefix):
+                yield item
+        finally:
+            req.close()
+
     def get_req(self, url, params=None):
-        return self.request(url, params, method='get')
+        return self.request(url, params, sign_type=self.config.READ_ONLY_SIGN_TYPE or SignType.RSA, method='get')
 
     def post_req(self, url, params=None):
         return self.request(url, params, method='post')
@@ -169,27 +453,44 @@ class PayClient(object):
             return result.data['is_opened']
         return False
 
+    def _account_user_cache_key(self, user_id):
+        return '{0}:{1}'.format(self.config.CHANNEL_NAME, user_id)
+
+    def _cache_account_user(self, user_id, result):
+        key = self._account_user_cache_key(user_id)
+        if is_success_result(result):
+            account_user_id = result.data['account_user_id']
+            self.account_user_cache.set(key, account_user_id)
+            return account_user_id
+        # 只缓存服务端明确的失败(如未开户); 请求失败或服务端异常(5xx)不缓存, 以便恢复后立即重试
+        is_definite_no = result is not None and result.status_code < 500
+        if is_definite_no and self.config.ACCOUNT_USER_NEGATIVE_CACHE_TTL > 0:
+            self.account_user_cache.set(key, None, ttl=self.config.ACCOUNT_USER_NEGATIVE_CACHE_TTL)
+        return None
+
     def get_account_user(self, user_id):
-        if user_id not in self._uid_accounts:
-            params = {
-                'user_id': user_id
-            }
-            url = self._generate_api_url(self.config.GET_ACCOUNT_USER_URL, **params)
-            result = self.get_req(url, params)
-            if is_success_result(result):
-                self._uid_accounts[user_id] = result.data['account_user_id']
-        return self._uid_accounts.get(user_id)
+        account_user_id = self.account_user_cache.get(self._account_user_cache_key(user_id), MISSING)
+        if account_user_id is not MISSING:
+            return account_user_id
+
+        params = {
+            'user_id': user_id
+        }
+        url = self._generate_api_url(self.config.GET_ACCOUNT_USER_URL, **params)
+        result = self.get_req(url, params)
+        return self._cache_account_user(user_id, result)
 
     def get_create_account_user(self, user_id):
-        if user_id not in self._uid_accounts:
-            params = {
-                'user_id': user_id
-            }
-            url = self._generate_api_url(self.config.GET_CREATE_ACCOUNT_USER_URL, **params)
-            result = self.post_req(url, params)
-            if is_success_result(result):
-                self._uid_accounts[user_id] = result.data['account_user_id']
-        return self._uid_accounts.get(user_id)
+        account_user_id = self.account_user_cache.get(self._account_user_cache_key(user_id))
+        if account_user_id is not None:
+            return account_user_id
+
+        params = {
+            'user_id': user_id
+        }
+        url = self._generate_api_url(self.config.GET_CREATE_ACCOUNT_USER_URL, **params)
+        result = self.post_req(url, params)
+        return self._cache_account_user(user_id, result)
 
     def web_checkout_url(self, sn, source=constant.TransactionType.PAYMENT):
         return self._generate_api_url(self.config.WEB_CHECKOUT_URL, source=source, sn=sn)
@@ -214,10 +515,13 @@ class PayClient(object):
 
         url = self._generate_api_url(self.config.PAYMENT_PARAM_URL, **params)
         if extra_params:
-            url = build_url(url, **extra_params)
+            url = append_query(url, extra_params)
         return self._do_request(url)
 
-    def web_payment_callback(self, sn, result):
+    def web_payment_callback(self, sn, result, stream=False):
+        """
+        :param stream: 为True时返回逐段生成表单页的generator, 用于流式响应
+        """
         params = {
             'sn': sn,
             'result': result
@@ -225,6 +529,8 @@ class PayClient(object):
         url = self._generate_api_url(self.config.PAYMENT_CALLBACK_URL)
 
         params = self._add_sign_to_params(params)
+        if stream:
+            return iter_submit_form(url, params)
         return submit_form(url, params)
 
     def zyt_pay(self, sn, payer_user_id):
@@ -239,6 +545,7 @@ class PayClient(object):
             return result.data['is_success']
         return None
 
+    @idempotent
     def preprepaid(self, to_user_id, amount, to_domain_name="", callback_url="", notify_url="", order_id=None):
         params = {
             'to_user_id': to_user_id,
@@ -303,6 +610,7 @@ class PayClient(object):
 
         return is_success_result(result)
 
+    @idempotent
     def refund(self, order_id=None, amount=None, notify_url=None, params=None, ret_result=False):
         if params is None:
             params = {
@@ -322,7 +630,7 @@ class PayClient(object):
             return result.data['sn']
         return None
 
-    def list_transactions(self, user_id, role, page_no, page_size, vas_name, q):
+    def _list_transactions_request(self, user_id, role, page_no, page_size, vas_name, q):
         url = self._generate_api_url(self.config.LIST_USER_TRANSACTIONS_URL, user_id=user_id)
 
         params = {
@@ -335,15 +643,48 @@ class PayClient(object):
         if vas_name:
             params['vas_name'] = vas_name
 
-        url = build_url(url, **params)
+        url = append_query(url, params)
 
         params['user_id'] = user_id
+        return url, params
+
+    def list_transactions(self, user_id, role, page_no, page_size, vas_name, q):
+        url, params = self._list_transactions_request(user_id, role, page_no, page_size, vas_name, q)
         result = self.get_req(url, params)
 
         if is_success_result(result):
             return result.data['data']
         return None
 
+    def stream_transactions(self, user_id, role, page_no, page_size, vas_name=None, q=None):
+        """ 同list_transactions, 但边接收边解析, 逐条返回这一页的交易记录, 适用于很大的page_size
+        """
+        url, params = self._list_transactions_request(user_id, role, page_no, page_size, vas_name, q)
+        prefix = 'data.{0}.item'.format(self.config.LIST_TRANSACTIONS_ITEMS_KEY)
+        return self.stream_items(url, params, prefix=prefix)
+
+    def iter_transaction_pages(self, user_id, role, page_size=None, vas_name=None, q=None, start_page=1,
+                               prefetch=False):
+        """ 逐页获取交易记录, 获取失败时抛出PageFetchError
+        :param prefetch: 是否在消费当前页时后台预取下一页
+        """
+        page_size = page_size or self.config.LIST_TRANSACTIONS_PAGE_SIZE
+
+        def fetch_page(page_no):
+            return self.list_transactions(user_id, role, page_no, page_size, vas_name, q)
+
+        pool = self._get_worker_pool() if prefetch else None
+        return iter_pages(fetch_page, page_size, start_page=start_page,
+                          items_key=self.config.LIST_TRANSACTIONS_ITEMS_KEY, pool=pool,
+                          total_key=self.config.LIST_TRANSACTIONS_TOTAL_KEY)
+
+    def iter_transactions(self, user_id, role, page_size=None, vas_name=None, q=None, prefetch=False):
+        """ 逐条返回所有交易记录, 内存中最多只保留一(预取时为两)页
+        """
+        for page in self.iter_transaction_pages(user_id, role, page_size, vas_name, q, prefetch=prefetch):
+            for item in page_items(page, self.config.LIST_TRANSACTIONS_ITEMS_KEY):
+                yield item
+
     def app_query_bin(self, card_no):
         params = {
             'card_no': card_no
@@ -399,6 +740,7 @@ class PayClient(object):
             return result.data['data']
         return None
 
+    @idempotent
     def app_withdraw(self, user_id, bankcard_id=None, amount=None, notify_url=None, order_id=None,
                      params=None, ret_result=False):
         if params is None:
@@ -490,6 +832,7 @@ class PayClient(object):
         return self.get_req(url, params=params)
 
     @which_to_return
+    @idempotent
     def user_transfer(self, user_id, to_user_domain_name, to_user_id, amount, info='', order_id=''):
         params = {
             'user_id': user_id,
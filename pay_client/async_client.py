@@ -0,0 +1,73 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+
+from . import PayClient
+from .batch import API_METHODS
+
+
+class AsyncPayClient(object):
+    """ 非阻塞的PayClient
+    API_METHODS中的方法与PayClient同名同参, 立即返回AsyncResult(get/ready/wait),
+    最多max_concurrency个调用同时进行, 超出的调用排队等待, 提交不会阻塞。
+    API方法和submit还接受callback/error_callback关键字参数, 调用完成时在线程池中以结果/异常调用,
+    可用于通知tornado/gevent等事件循环(如ioloop.add_callback), 不必阻塞在get上。
+    其它属性和方法(config, checkout_url, verify_request...)直接使用内部的PayClient。
+    """
+    def __init__(self, env_config=None, client=None, max_concurrency=None):
+        """
+        :param env_config: 用于创建内部的PayClient
+        :param client: 直接使用已有的PayClient, 共享其配置、签名和连接池
+        :param max_concurrency: 最大并发调用数, 默认为Config.ASYNC_MAX_CONCURRENCY
+        """
+        self._owns_client = client is None
+        self.client = client if client is not None else PayClient(env_config)
+        self.max_concurrency = max_concurrency or self.client.config.ASYNC_MAX_CONCURRENCY
+        self._pool = ThreadPool(self.max_concurrency)
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def submit(self, func, *args, **kwargs):
+        """ 提交func(*args, **kwargs), 立即返回AsyncResult
+        :param callback: 关键字参数, 成功时以返回值调用
+        :param error_callback: 关键字参数, 抛出异常时以异常调用(py2的Pool没有此参数)
+        """
+        callback = kwargs.pop('callback', None)
+        error_callback = kwargs.pop('error_callback', None)
+        # 线程池的线程数即最大并发数, 超出的调用在池的队列中等待
+        if error_callback is None:
+            return self._pool.apply_async(func, args, kwargs, callback=callback)
+        return self._pool.apply_async(_call_with_error_callback, (func, args, kwargs, error_callback),
+                                      callback=callback)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        if self._owns_client:
+            self.client.close()
+
+
+def _call_with_error_callback(func, args, kwargs, error_callback):
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        error_callback(e)
+        raise
+
+
+def _async_api_method(name):
+    def method(self, *args, **kwargs):
+        return self.submit(getattr(self.client, name), *args, **kwargs)
+
+    method.__name__ = str(name)
+    method.__doc__ = 'async version of PayClient.{0}, returns AsyncResult; ' \
+                     'accepts callback/error_callback keyword arguments.'.format(name)
+    return method
+
+
+for _name in API_METHODS:
+    setattr(AsyncPayClient, _name, _async_api_method(_name))
@@ -0,0 +1,102 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import time
+from collections import namedtuple
+from multiprocessing import TimeoutError
+
+from ..util.log import get_logger
+
+logger = get_logger(__name__)
+CallResult = namedtuple('CallResult', 'value, error')
+
+
+class CallTimeoutError(TimeoutError):
+    def __init__(self, method, timeout):
+        message = "api call [{0}] timed out after [{1}]s.".format(method, timeout)
+        super(CallTimeoutError, self).__init__(message)
+
+# 会发起网络请求的api方法
+API_METHODS = (
+    'request', 'get_req', 'post_req',
+    'query_user_is_opened', 'get_account_user', 'get_create_account_user',
+    'get_payment_result', 'get_payment_info', 'get_payment_param', 'zyt_pay',
+    'preprepaid', 'prepaid_web_checkout_url', 'prepay', 'prepay_channel_order', 'pay_web_checkout_url',
+    'confirm_guarantee_payment', 'refund', 'list_transactions',
+    'app_query_bin', 'app_bind_bankcard', 'app_unbind_bankcard', 'app_get_user_bankcard', 'app_list_user_bankcards',
+    'app_withdraw', 'app_query_withdraw', 'app_query_user_balance', 'app_query_user_available_balance',
+    'app_draw_cheque', 'app_cash_cheque', 'app_cancel_cheque', 'app_list_cheque',
+    'user_transfer',
+)
+
+
+class Batch(object):
+    """ 收集多个api调用, 并发执行后按顺序返回CallResult
+    b = client.batch()
+    b.app_query_user_balance(user_id)
+    b.app_list_cheque(user_id)
+    balance, cheques = b.run()
+    """
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name not in API_METHODS:
+            raise AttributeError(name)
+
+        def add_call(*args, **kwargs):
+            return self.add(name, *args, **kwargs)
+        return add_call
+
+    def __len__(self):
+        return len(self._calls)
+
+    def add(self, method, *args, **kwargs):
+        if method not in API_METHODS:
+            raise ValueError("unknown api method [{0}].".format(method))
+        self._calls.append((method, args, kwargs))
+        return self
+
+    def run(self, timeout=None):
+        return self._client.gather(self._calls, timeout=timeout)
+
+
+def normalize_calls(calls):
+    """ (method, args[, kwargs]) => (method, args, kwargs)
+    """
+    normalized = []
+    for call in calls:
+        call = tuple(call)
+        method = call[0]
+        args = call[1] if len(call) > 1 else ()
+        kwargs = call[2] if len(call) > 2 else {}
+        if method not in API_METHODS:
+            raise ValueError("unknown api method [{0}].".format(method))
+        normalized.append((method, tuple(args), dict(kwargs)))
+    return normalized
+
+
+def run_call(client, method, args, kwargs):
+    try:
+        return CallResult(getattr(client, method)(*args, **kwargs), None)
+    except Exception as e:
+        logger.exception(e)
+        return CallResult(None, e)
+
+
+def collect_results(calls, pending, timeout=None):
+    """ 按顺序取pool.apply_async的结果, 所有调用共用一个截止时间, 超时的调用结果为CallTimeoutError
+    :param timeout: 等待全部调用的总超时(秒)
+    """
+    if timeout is None:
+        return [p.get() for p in pending]
+
+    deadline = time.time() + timeout
+    results = []
+    for call, p in zip(calls, pending):
+        try:
+            results.append(p.get(max(deadline - time.time(), 0)))
+        except TimeoutError:
+            results.append(CallResult(None, CallTimeoutError(call[0], timeout)))
+    return results
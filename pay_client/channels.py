@@ -0,0 +1,111 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+from ..util import public_key
+from ..util.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _release_keys(client):
+    """ 释放的渠道不再使用其私钥, 从进程内的public_key.registry中移除, 以免缓存一直持有
+    """
+    if client.config.CHANNEL_PRI_KEY:
+        public_key.registry.discard(client.config.CHANNEL_PRI_KEY)
+
+
+class ChannelRegistry(object):
+    """ 按channel_name管理多个渠道的client
+    register的渠道在首次使用时才创建client(加载私钥等), 与parent共用连接池和缓存;
+    加载的渠道数超过max_loaded, 或闲置超过max_idle秒时释放其client, 再次使用时重新加载
+    """
+    def __init__(self, parent, max_loaded=None, max_idle=None):
+        self.parent = parent
+        self.max_loaded = max_loaded
+        self.max_idle = max_idle
+        self._configs = {}
+        # 直接添加的client没有配置可以重新加载, 不会被释放
+        self._pinned = {}
+        # channel_name => (client, last_used), 按最近使用排序
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._configs) + len(self._pinned)
+
+    def __contains__(self, channel_name):
+        return channel_name in self._configs or channel_name in self._pinned
+
+    def register(self, env_config, channel_name=None):
+        channel_name = channel_name or env_config.CHANNEL_NAME
+        with self._lock:
+            self._configs[channel_name] = env_config
+            entry = self._loaded.pop(channel_name, None)
+            if entry is not None:
+                _release_keys(entry[0])
+
+    def add_client(self, client):
+        with self._lock:
+            self._pinned[client.config.CHANNEL_NAME] = client
+
+    def get(self, channel_name):
+        now = time.time()
+        with self._lock:
+            client = self._pinned.get(channel_name)
+            if client is not None:
+                return client
+
+            entry = self._loaded.pop(channel_name, None)
+            if entry is not None:
+                self._loaded[channel_name] = (entry[0], now)
+                self._evict(now)
+                return entry[0]
+
+            env_config = self._configs.get(channel_name)
+        if env_config is None:
+            return None
+
+        # 加载私钥较慢, 不持有锁
+        client = type(self.parent)(env_config, shared=self.parent)
+        with self._lock:
+            entry = self._loaded.pop(channel_name, None)
+            if entry is not None:
+                client = entry[0]
+            else:
+                self._loads += 1
+            self._loaded[channel_name] = (client, now)
+            self._evict(now)
+        return client
+
+    def _evict(self, now):
+        while self._loaded:
+            channel_name = next(iter(self._loaded))
+            last_used = self._loaded[channel_name][1]
+            over_size = self.max_loaded is not None and len(self._loaded) > self.max_loaded
+            idle = self.max_idle is not None and now - last_used > self.max_idle
+            if not over_size and not idle:
+                break
+            client = self._loaded.pop(channel_name)[0]
+            _release_keys(client)
+            self._evictions += 1
+            logger.info("unload channel [{0}].".format(channel_name))
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'registered': len(self._configs),
+                'pinned': len(self._pinned),
+                'loaded': len(self._loaded),
+                'loads': self._loads,
+                'evictions': self._evictions,
+            }
@@ -7,6 +7,65 @@ class Config:
     # sample
     CHANNEL_NAME = 'zyt_sample'
 
+    # http连接池
+    HTTP_POOL_CONNECTIONS = 10
+    HTTP_POOL_MAXSIZE = 10
+    HTTP_POOL_BLOCK = False
+    HTTP_KEEP_ALIVE = True
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_READ_TIMEOUT = 30
+
+    # 请求策略: 超时、重试(只重试get请求)、熔断和总时间预算
+    # REQUEST_POLICIES可按endpoint模板覆盖, 如 {'/biz/refund': {'read_timeout': 60, 'deadline': 90}}
+    REQUEST_MAX_RETRIES = 2
+    REQUEST_BACKOFF_BASE = 0.1
+    REQUEST_BACKOFF_MAX = 2
+    REQUEST_DEADLINE = 60
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_RECOVERY_TIMEOUT = 30
+    REQUEST_POLICIES = {}
+
+    # 按endpoint模板统计耗时、状态码、签名验签耗时和报文大小
+    # 启用时在内存中聚合(PayClient.metrics_snapshot), 配置了METRICS_STATSD_HOST时同时以statsd协议发送
+    METRICS_ENABLED = False
+    METRICS_STATSD_HOST = None
+    METRICS_STATSD_PORT = 8125
+    METRICS_PREFIX = 'pay_client'
+
+    # refund, app_withdraw, user_transfer, preprepaid按order_id去重: 并发的相同调用只请求一次,
+    # 成功的结果在IDEMPOTENCY_WINDOW秒内直接返回
+    IDEMPOTENCY_WINDOW = 60
+    IDEMPOTENCY_CACHE_SIZE = 10000
+
+    # RSA签名缓存, 相同的请求参数不再重复签名
+    SIGN_CACHE_SIZE = 1024
+    SIGN_CACHE_TTL = 600
+    # get请求的签名方式, 如设为'MD5'则只读请求使用MD5_KEY签名, 不做RSA运算
+    READ_ONLY_SIGN_TYPE = None
+
+    # register_accepted_channels注册的渠道最多同时加载的个数和最长闲置时间(秒), 超出后释放其私钥等
+    CHANNEL_MAX_LOADED = 256
+    CHANNEL_MAX_IDLE = 3600
+
+    # AsyncPayClient最大并发调用数, HTTP_POOL_MAXSIZE需相应调大才能复用连接
+    ASYNC_MAX_CONCURRENCY = 100
+    # batch/gather并发执行的线程数
+    BATCH_MAX_WORKERS = 8
+    # verify_many验签的进程数, None为cpu核数, 0为不使用进程池
+    VERIFY_PROCESSES = None
+    # 需RSA验签的请求少于此数时在当前进程中验签, 省去进程间通信
+    VERIFY_MIN_PARALLEL = 32
+
+    # user_id => account_user_id缓存
+    ACCOUNT_USER_CACHE_SIZE = 10000
+    ACCOUNT_USER_CACHE_TTL = 3600
+    # 未开户等失败结果的缓存时间, 0表示不缓存
+    ACCOUNT_USER_NEGATIVE_CACHE_TTL = 30
+
+    # 回调验签时解密出的对方公钥(Signer)缓存
+    VERIFY_KEY_CACHE_SIZE = 64
+    VERIFY_KEY_CACHE_TTL = 3600
+
     ROOT_URL = "http://pay.lvye.com/api/__"
     QUERY_USER_IS_OPENED_URL = "/user_mapping/users/{user_id}/is_opened"
     PREPAY_URL = '/biz/prepay'
@@ -43,5 +102,10 @@ class Config:
     GET_CREATE_ACCOUNT_USER_URL = '/user_mapping/users/{user_id}'
 
     LIST_USER_TRANSACTIONS_URL = "/biz/users/{user_id}/transactions"
+    # iter_transactions默认每页条数及每页数据中交易列表的key, key需与服务端返回的数据一致, 缺少时抛出PageFetchError
+    LIST_TRANSACTIONS_PAGE_SIZE = 100
+    LIST_TRANSACTIONS_ITEMS_KEY = 'infos'
+    # 每页数据中总条数的key, 有总条数时按其判断是否取完, 未取完就出现不足一页的数据时抛出PageFetchError
+    LIST_TRANSACTIONS_TOTAL_KEY = 'total'
 
     USER_TRANSFER_URL = "/biz/users/{user_id}/transfer"
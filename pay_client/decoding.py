@@ -0,0 +1,60 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import json
+from decimal import Decimal
+
+try:
+    # 有c扩展时比标准库json快很多, 且可以直接解析出Decimal
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class ResponseError(Exception):
+    def __init__(self, status_code, body=None):
+        message = "Bad response [{0}]: {1}".format(status_code, body)
+        super(ResponseError, self).__init__(message)
+        self.status_code = status_code
+
+
+def loads(body):
+    """ 解析json, 数字保持Decimal精度
+    :param body: bytes或unicode
+    """
+    if simplejson is not None:
+        return simplejson.loads(body, use_decimal=True)
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    return json.loads(body, parse_float=Decimal)
+
+
+def _get_path(data, prefix):
+    """ 按ijson的prefix格式取值, 如 data.data.item => data['data']['data']
+    """
+    for name in prefix.split('.'):
+        if name == 'item':
+            break
+        data = data.get(name) if isinstance(data, dict) else None
+        if data is None:
+            return []
+    return data
+
+
+def iter_items(fileobj, prefix='data.item'):
+    """ 逐个解析出json中prefix处数组的元素, 不在内存中保留整个报文
+    没有安装ijson时整体解析后再逐个返回
+    :param fileobj: 提供read的对象, 如requests响应的raw
+    :param prefix: ijson的prefix格式
+    """
+    if ijson is not None:
+        for item in ijson.items(fileobj, prefix):
+            yield item
+        return
+    for item in _get_path(loads(fileobj.read()), prefix):
+        yield item
@@ -0,0 +1,91 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import re
+import urllib
+from string import Formatter
+
+from .utils import ApiUrl
+from ..util.encoding import to_str
+
+# 不是相对ROOT_URL的endpoint
+ABSOLUTE_URL_NAMES = {'ROOT_URL', 'CHECKOUT_URL'}
+
+_SAFE_VALUE = re.compile(r'[A-Za-z0-9_.~-]*\Z')
+_FIELD_NAME_END = re.compile(r'[.\[]')
+
+
+def _quote(value, quote=urllib.quote):
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    if _SAFE_VALUE.match(value):
+        return value
+    return quote(to_str(value), safe=b'')
+
+
+def _quote_plus(value):
+    return _quote(value, urllib.quote_plus)
+
+
+class UrlTemplate(object):
+    """ 预编译的endpoint模板, 生成的url带有模板信息(ApiUrl)
+    /application/users/{user_id}/balance => ROOT_URL/application/users/u%2F1/balance
+    """
+    def __init__(self, root_url, template):
+        self.template = template
+        self._url_type = ApiUrl.of(template)
+        root_url = root_url if root_url.endswith('/') else root_url + '/'
+        path = template.lstrip('/')
+
+        fmt = [root_url.replace('%', '%%')]
+        field_names = []
+        simple = True
+        for literal, field, format_spec, conversion in Formatter().parse(path):
+            fmt.append(literal.replace('%', '%%'))
+            if field is not None:
+                if format_spec or conversion or not field.replace('_', '').isalnum():
+                    simple = False
+                fmt.append('%s')
+                field_names.append(field)
+
+        self._root_url = root_url
+        self._path = path
+        self._simple = simple
+        self._fmt = ''.join(fmt)
+        self._field_names = tuple(field_names)
+        self.fields = frozenset(_FIELD_NAME_END.split(f, 1)[0] for f in field_names)
+
+    def format(self, **kwargs):
+        try:
+            if self._simple:
+                return self._url_type(self._fmt % tuple([_quote(kwargs[f]) for f in self._field_names]))
+            return self._url_type(self._root_url + self._path.format(**kwargs))
+        except KeyError:
+            missing = self.fields.difference(kwargs)
+            if not missing:
+                raise
+            raise KeyError("missing url params {0} for [{1}].".format(sorted(missing), self.template))
+
+
+def compile_endpoints(config, root_url=None):
+    """ 编译config中所有相对ROOT_URL的*_URL
+    :return: {template: UrlTemplate}
+    """
+    root_url = root_url or config.ROOT_URL
+    endpoints = {}
+    for name in dir(config):
+        if name.endswith('_URL') and name not in ABSOLUTE_URL_NAMES:
+            template = getattr(config, name)
+            if template not in endpoints:
+                endpoints[template] = UrlTemplate(root_url, template)
+    return endpoints
+
+
+def append_query(url, params):
+    """ 追加query参数, 代替build_url(url, **params), 保留url的endpoint模板
+    """
+    if not params:
+        return url
+    query = '&'.join([_quote_plus(k) + '=' + _quote_plus(v) for k, v in params.items()])
+    url_type = type(url) if isinstance(url, ApiUrl) else ApiUrl
+    return url_type('{0}{1}{2}'.format(url, '&' if '?' in url else '?', query))
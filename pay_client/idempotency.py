@@ -0,0 +1,111 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import inspect
+import json
+import threading
+from functools import wraps
+from hashlib import sha1
+
+from ..util.cache import LRUCache, MISSING
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ 相同key的并发调用只执行一次, 其它调用等待并共享其结果;
+    执行成功的结果在window秒内直接返回
+    """
+    def __init__(self, window=60, max_size=10000):
+        self._results = LRUCache(max_size, window)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+        self._replayed = 0
+
+    def do(self, key, func, *args, **kwargs):
+        result = self._results.get(key, MISSING)
+        if result is not MISSING:
+            with self._lock:
+                self._replayed += 1
+            return result
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                self._coalesced += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            if _is_recordable(call.result):
+                self._results.set(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executed': self._executed,
+                'coalesced': self._coalesced,
+                'replayed': self._replayed,
+            }
+
+
+def _is_recordable(result):
+    """ 只记录成功的结果, 对所有方法统一:
+    返回Result(ret_result或which_to_return)时需状态码<500且ret为真, 其它返回值需不为None;
+    请求失败、服务端异常和业务失败(如余额不足)都不记录, 以便上游修正后重试
+    """
+    if result is None:
+        return False
+    if hasattr(result, 'status_code'):
+        return result.status_code < 500 and isinstance(result.data, dict) and bool(result.data.get('ret'))
+    return True
+
+
+def _order_key(callargs):
+    params = callargs.get('params') or {}
+    return callargs.get('order_id') or callargs.get('sn') or params.get('order_id') or params.get('sn')
+
+
+def _digest(callargs):
+    return sha1(json.dumps(callargs, sort_keys=True, default=unicode).encode('utf-8')).hexdigest()
+
+
+def idempotent(func):
+    """ 用于PayClient中会动账的方法: 按(方法, order_id/sn, 参数摘要)去重
+    没有order_id/sn的调用无法区分是否为重试, 不做去重
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        callargs = inspect.getcallargs(func, self, *args, **kwargs)
+        callargs.pop('self')
+        order_key = _order_key(callargs)
+        if not order_key:
+            return func(self, *args, **kwargs)
+
+        key = (self.config.CHANNEL_NAME, func.__name__, order_key, _digest(callargs))
+        return self.single_flight.do(key, func, self, *args, **kwargs)
+    return wrapper
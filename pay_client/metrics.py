@@ -0,0 +1,190 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import re
+import socket
+import threading
+from bisect import bisect_left
+from timeit import default_timer as timer
+
+from ..util.log import get_logger
+
+logger = get_logger(__name__)
+
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+VERIFY_ENDPOINT = 'verify'
+
+_NON_METRIC_CHARS = re.compile(r'[^a-zA-Z0-9_.]+')
+
+
+def metric_name(endpoint):
+    """ endpoint模板 => 可用于statsd的名字
+    /application/users/{user_id}/balance => application.users.user_id.balance
+    """
+    name = endpoint.strip('/').replace('{', '').replace('}', '').replace('/', '.')
+    return _NON_METRIC_CHARS.sub('_', name) or '_'
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """ 按桶估算的百分位数, 返回所在桶的上界
+        """
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / float(self.count) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['inf'], self.counts)),
+        }
+
+
+class MemoryExporter(object):
+    """ 在内存中按endpoint聚合, 通过snapshot()查看
+    """
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, endpoint, metric, value=1):
+        key = (endpoint, metric)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, endpoint, metric, value, buckets):
+        key = (endpoint, metric)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timing(self, endpoint, metric, ms):
+        self._observe(endpoint, metric, ms, LATENCY_BUCKETS)
+
+    def histogram(self, endpoint, metric, value):
+        self._observe(endpoint, metric, value, SIZE_BUCKETS)
+
+    def snapshot(self):
+        result = {}
+        with self._lock:
+            for (endpoint, metric), value in self._counters.items():
+                result.setdefault(endpoint, {})[metric] = value
+            for (endpoint, metric), histogram in self._histograms.items():
+                result.setdefault(endpoint, {})[metric] = histogram.snapshot()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class StatsdExporter(object):
+    """ 以statsd行协议通过udp发送, 如 pay_client.application.users.user_id.balance.request_ms:12.3|ms
+    """
+    def __init__(self, host='127.0.0.1', port=8125, prefix='pay_client'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._names = {}
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, endpoint, metric):
+        name = self._names.get(endpoint)
+        if name is None:
+            name = self._names[endpoint] = '{0}.{1}'.format(self.prefix, metric_name(endpoint))
+        return '{0}.{1}'.format(name, metric)
+
+    def _send(self, line):
+        try:
+            self._sock.sendto(line.encode('utf-8'), self.address)
+        except Exception as e:
+            logger.warn('failed to send metric [{0}]: {1}'.format(line, e))
+
+    def incr(self, endpoint, metric, value=1):
+        self._send('{0}:{1}|c'.format(self._name(endpoint, metric), value))
+
+    def timing(self, endpoint, metric, ms):
+        self._send('{0}:{1:.3f}|ms'.format(self._name(endpoint, metric), ms))
+
+    def histogram(self, endpoint, metric, value):
+        self._send('{0}:{1}|h'.format(self._name(endpoint, metric), value))
+
+
+class Instrumentation(object):
+    """ 分发指标到各exporter, 没有exporter时enabled为False, 调用方应先判断以免计时开销
+    """
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+        self.enabled = bool(self.exporters)
+
+    @classmethod
+    def from_config(cls, config):
+        exporters = []
+        if config.METRICS_ENABLED:
+            exporters.append(MemoryExporter())
+            if config.METRICS_STATSD_HOST:
+                exporters.append(StatsdExporter(config.METRICS_STATSD_HOST, config.METRICS_STATSD_PORT,
+                                                config.METRICS_PREFIX))
+        return cls(exporters)
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        self.enabled = True
+
+    def remove_exporter(self, exporter):
+        self.exporters.remove(exporter)
+        self.enabled = bool(self.exporters)
+
+    def incr(self, endpoint, metric, value=1):
+        for exporter in self.exporters:
+            exporter.incr(endpoint, metric, value)
+
+    def timing(self, endpoint, metric, ms):
+        for exporter in self.exporters:
+            exporter.timing(endpoint, metric, ms)
+
+    def histogram(self, endpoint, metric, value):
+        for exporter in self.exporters:
+            exporter.histogram(endpoint, metric, value)
+
+    def snapshot(self):
+        for exporter in self.exporters:
+            if isinstance(exporter, MemoryExporter):
+                return exporter.snapshot()
+        return {}
+
+
+def elapsed_ms(start):
+    return (timer() - start) * 1000
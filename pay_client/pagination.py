@@ -0,0 +1,71 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+
+class PageFetchError(Exception):
+    def __init__(self, page_no, reason=None):
+        message = "Failed to fetch page [{0}].".format(page_no)
+        if reason:
+            message = "Failed to fetch page [{0}]: {1}.".format(page_no, reason)
+        super(PageFetchError, self).__init__(message)
+        self.page_no = page_no
+
+
+def page_items(page, items_key):
+    """ 分页数据中的列表, page本身为列表或者其items_key的值为列表
+    page为dict但没有items_key时抛出KeyError, 避免把格式不符的页当作最后一页而静默截断
+    """
+    if isinstance(page, dict):
+        if items_key not in page:
+            raise KeyError(items_key)
+        return page[items_key] or []
+    return page or []
+
+
+def page_total(page, total_key):
+    """ 分页数据中的总条目数, 没有时返回None
+    """
+    if isinstance(page, dict) and total_key:
+        total = page.get(total_key)
+        if total is not None:
+            return int(total)
+    return None
+
+
+def iter_pages(fetch_page, page_size, start_page=1, items_key=None, pool=None, total_key='total'):
+    """ 逐页获取; 页中有总条目数时取完total条结束, 否则某页的条目数小于page_size时结束
+    有total时, 在取完之前出现不足page_size的页(如服务端限制了page_size)抛出PageFetchError, 而不是静默截断
+    :param fetch_page: fetch_page(page_no) => page, 失败时返回None
+    :param page_size: 每页条目数
+    :param start_page: 起始页码
+    :param items_key: 见page_items
+    :param pool: 提供apply_async的线程池, 传入时在消费当前页的同时预取下一页
+    :param total_key: 页中总条目数的key
+    """
+    page_no = start_page
+    fetched = (start_page - 1) * page_size
+    pending = None
+    while True:
+        page = pending.get() if pending is not None else fetch_page(page_no)
+        if page is None:
+            raise PageFetchError(page_no)
+        try:
+            items = page_items(page, items_key)
+        except KeyError:
+            raise PageFetchError(page_no, "no [{0}] in page".format(items_key))
+
+        fetched += len(items)
+        total = page_total(page, total_key)
+        if total is None:
+            is_last = len(items) < page_size
+        else:
+            is_last = fetched >= total
+            if not is_last and len(items) < page_size:
+                raise PageFetchError(page_no, "got [{0}] items, expected [{1}] of total [{2}]".format(
+                    len(items), page_size, total))
+        pending = pool.apply_async(fetch_page, (page_no + 1,)) if pool is not None and not is_last else None
+
+        yield page
+        if is_last:
+            return
+        page_no += 1
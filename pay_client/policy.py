@@ -0,0 +1,161 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import random
+import threading
+import time
+
+# 没有endpoint模板的url共用此策略
+DEFAULT_ENDPOINT = '*'
+
+
+class CircuitState:
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+
+class RequestPolicy(object):
+    def __init__(self, connect_timeout=None, read_timeout=None, max_retries=0, backoff_base=0.1, backoff_max=2,
+                 deadline=None, failure_threshold=5, recovery_timeout=30):
+        """
+        :param connect_timeout: 连接超时(秒)
+        :param read_timeout: 读取超时(秒)
+        :param max_retries: 最大重试次数, 只对get请求生效
+        :param backoff_base: 第n次重试前等待 [0, backoff_base * 2^n] 内的随机时长
+        :param backoff_max: 重试等待的上限
+        :param deadline: 一次调用(含重试)的总时间预算(秒)
+        :param failure_threshold: 连续失败多少次后熔断
+        :param recovery_timeout: 熔断多久后放行一次试探请求
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+    @classmethod
+    def from_config(cls, config, endpoint=DEFAULT_ENDPOINT):
+        settings = {
+            'connect_timeout': config.HTTP_CONNECT_TIMEOUT,
+            'read_timeout': config.HTTP_READ_TIMEOUT,
+            'max_retries': config.REQUEST_MAX_RETRIES,
+            'backoff_base': config.REQUEST_BACKOFF_BASE,
+            'backoff_max': config.REQUEST_BACKOFF_MAX,
+            'deadline': config.REQUEST_DEADLINE,
+            'failure_threshold': config.CIRCUIT_FAILURE_THRESHOLD,
+            'recovery_timeout': config.CIRCUIT_RECOVERY_TIMEOUT,
+        }
+        settings.update(config.REQUEST_POLICIES.get(endpoint, {}))
+        return cls(**settings)
+
+    def attempts(self, method):
+        if method.lower() == 'get':
+            return self.max_retries + 1
+        return 1
+
+    def backoff(self, retry_no):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry_no)))
+
+    def timeout(self, remaining=None):
+        """ (connect_timeout, read_timeout), 不超过剩余的时间预算
+        """
+        if remaining is None:
+            return self.connect_timeout, self.read_timeout
+        return _bounded(self.connect_timeout, remaining), _bounded(self.read_timeout, remaining)
+
+
+def _bounded(timeout, remaining):
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+
+class CircuitBreaker(object):
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ 是否放行请求, 熔断期间直接拒绝, 超过recovery_timeout后只放行一个试探请求
+        """
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+            if self.state == CircuitState.OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+                self.state = CircuitState.HALF_OPEN
+                self._trial_running = False
+            if self.state == CircuitState.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = CircuitState.CLOSED
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = CircuitState.OPEN
+                self._opened_at = time.time()
+                self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self._failures,
+                'rejected': self._rejected,
+            }
+
+
+class RequestPolicies(object):
+    """ 按endpoint模板管理请求策略和熔断器
+    """
+    def __init__(self, config):
+        self.config = config
+        self._policies = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        endpoint = endpoint or DEFAULT_ENDPOINT
+        policy = self._policies.get(endpoint)
+        if policy is None:
+            with self._lock:
+                policy = self._policies.get(endpoint)
+                if policy is None:
+                    policy = RequestPolicy.from_config(self.config, endpoint)
+                    self._policies[endpoint] = policy
+        return policy
+
+    def breaker(self, endpoint):
+        endpoint = endpoint or DEFAULT_ENDPOINT
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            policy = self.get(endpoint)
+            with self._lock:
+                breaker = self._breakers.get(endpoint)
+                if breaker is None:
+                    breaker = CircuitBreaker(policy.failure_threshold, policy.recovery_timeout)
+                    self._breakers[endpoint] = breaker
+        return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {endpoint: breaker.stats() for endpoint, breaker in breakers.items()}
@@ -0,0 +1,97 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import threading
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HostPoolStats = namedtuple('HostPoolStats', 'scheme, host, port, num_connections, num_requests, idle_connections')
+
+
+class HttpSession(object):
+    """ 带连接池的keep-alive会话, 由PayClient的所有请求共享
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True,
+                 connect_timeout=None, read_timeout=None):
+        """
+        :param pool_connections: 缓存的host连接池个数
+        :param pool_maxsize: 每个host连接池的最大连接数
+        :param pool_block: 连接池满时是否阻塞等待空闲连接
+        :param keep_alive: 是否复用连接
+        :param connect_timeout: 建立连接超时(秒)
+        :param read_timeout: 读取响应超时(秒)
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+        self._session = requests.Session()
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+        if not keep_alive:
+            self._session.headers['Connection'] = 'close'
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(pool_connections=config.HTTP_POOL_CONNECTIONS,
+                   pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                   pool_block=config.HTTP_POOL_BLOCK,
+                   keep_alive=config.HTTP_KEEP_ALIVE,
+                   connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+                   read_timeout=config.HTTP_READ_TIMEOUT)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        try:
+            return self._session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        """ 连接池使用情况
+        num_connections为新建连接数, 与num_requests相比可看出连接复用情况
+        """
+        host_stats = []
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # 队列中预先填充了None占位, 只有非None的才是空闲连接
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0
+            host_stats.append(HostPoolStats(pool.scheme, pool.host, pool.port,
+                                            pool.num_connections, pool.num_requests, idle))
+        with self._lock:
+            return {
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'requests': self._requests,
+                'errors': self._errors,
+                'in_flight': self._in_flight,
+                'max_in_flight': self._max_in_flight,
+                'hosts': host_stats,
+            }
+
+    def close(self):
+        self._session.close()
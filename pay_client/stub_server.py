@@ -0,0 +1,245 @@
+# coding=utf-8
+"""
+本地模拟的支付服务, 实现了config中的api, 用于压测和调试PayClient, 不依赖pay.lvye.com
+
+server = StubPayServer(latency=0.01, error_rate=0.01).start()
+client = PayClient(env_config)  # env_config.ROOT_URL = server.root_url
+压测并发时可用start(process=True)在单独的进程中运行, 不与被测的client争用GIL
+...
+server.stop()
+"""
+from __future__ import unicode_literals
+
+import BaseHTTPServer
+import SocketServer
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+import urlparse
+import uuid
+from decimal import Decimal
+from string import Formatter
+
+import simplejson
+
+from .config import Config
+from ..util import public_key
+from ..util.sign import SignType, Signer
+
+
+def _sn():
+    return uuid.uuid4().hex
+
+
+def _transactions(params, path_params):
+    page_no = int(params.get('page_no') or 1)
+    page_size = int(params.get('page_size') or 20)
+    total = int(params.get('_total') or 1000)
+    start = (page_no - 1) * page_size
+    infos = [{'sn': '{0:020d}'.format(i), 'amount': '1.00', 'state': 'SUCCESS'}
+             for i in range(start, min(total, start + page_size))]
+    return {'data': {'total': total, 'infos': infos}}
+
+
+# config name => 生成返回数据
+RESPONSES = {
+    'QUERY_USER_IS_OPENED_URL': lambda p, pp: {'is_opened': True},
+    'GET_ACCOUNT_USER_URL': lambda p, pp: {'account_user_id': abs(hash(pp['user_id'])) % 100000000},
+    'PREPAY_URL': lambda p, pp: {'sn': _sn(), 'pay_url': 'http://pay.lvye.com/checkout/stub'},
+    'PREPAY_CHANNEL_ORDER_URL': lambda p, pp: {'sn': _sn(), 'pay_url': 'http://pay.lvye.com/checkout/stub'},
+    'CONFIRM_GUARANTEE_PAYMENT_URL': lambda p, pp: {},
+    'REFUND_URL': lambda p, pp: {'sn': _sn()},
+    'APP_DRAW_CHEQUE_URL': lambda p, pp: {'sn': _sn(), 'cash_token': _sn()},
+    'APP_CASH_CHEQUE_URL': lambda p, pp: {'sn': _sn()},
+    'APP_CANCEL_CHEQUE_URL': lambda p, pp: {},
+    'APP_LIST_CHEQUE_URL': lambda p, pp: {'data': []},
+    'APP_WITHDRAW_URL': lambda p, pp: {'sn': _sn()},
+    'APP_QUERY_WITHDRAW_URL': lambda p, pp: {'data': {'sn': pp['sn'], 'state': 'SUCCESS'}},
+    'APP_QUERY_BIN_URL': lambda p, pp: {'data': {'card_no': pp['card_no'], 'bank_name': 'STUB', 'card_type': 'DEBIT'}},
+    'APP_BIND_BANKCARD_URL': lambda p, pp: {'id': 1},
+    'APP_UNBIND_BANKCARD_URL': lambda p, pp: {},
+    'APP_GET_USER_BANKCARD_URL': lambda p, pp: {'data': {'id': pp['bankcard_id'], 'bank_name': 'STUB'}},
+    'APP_LIST_USER_BANKCARDS_URL': lambda p, pp: {'data': []},
+    'APP_QUERY_USER_BALANCE_URL': lambda p, pp: {'data': {'total': Decimal('100.00'), 'available': Decimal('90.00'),
+                                                          'frozen': Decimal('10.00')}},
+    'PREPREPAID_URL': lambda p, pp: {'sn': _sn()},
+    'PAYMENT_RESULT_URL': lambda p, pp: {'sn': pp['sn'], 'state': 'SUCCESS'},
+    'PAYMENT_INFO_URL': lambda p, pp: {'sn': pp['sn'], 'amount': Decimal('1.00')},
+    'PAYMENT_PARAM_URL': lambda p, pp: {'sn': pp['sn'], 'params': {}},
+    'ZYT_PAY_URL': lambda p, pp: {'is_success': True},
+    'LIST_USER_TRANSACTIONS_URL': _transactions,
+    'USER_TRANSFER_URL': lambda p, pp: {'sn': _sn()},
+}
+
+
+def _compile_routes(config):
+    routes = []
+    for name in sorted(RESPONSES):
+        template = getattr(config, name).strip('/')
+        pattern = ''.join([re.escape(literal) + ('(?P<{0}>[^/]+)'.format(field) if field else '')
+                           for literal, field, _, _ in Formatter().parse(template)])
+        routes.append((re.compile('^' + pattern + '/?$'), name))
+    return routes
+
+
+class StubPayServer(object):
+    def __init__(self, config=Config, host='127.0.0.1', port=0, latency=0, latency_jitter=0, error_rate=0,
+                 pri_key=None):
+        """
+        :param config: 用于生成路由的endpoint配置
+        :param latency: 每个请求的固定延迟(秒)
+        :param latency_jitter: 附加的 [0, latency_jitter] 随机延迟
+        :param error_rate: 返回500的比例
+        :param pri_key: 用于给返回签名的私钥(base64), 默认生成测试用的key
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.routes = _compile_routes(config)
+        self.root_path = urlparse.urlparse(config.ROOT_URL).path.strip('/')
+
+        if pri_key is None:
+            pri_key = public_key.generate_key(1024).b64encoded_binary_key_data()
+        self.signer = Signer('key', 'sign', pri_key=pri_key)
+
+        self._server = _ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread = None
+        self._process = None
+
+    @property
+    def root_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}/{2}'.format(host, port, self.root_path)
+
+    def start(self, process=False):
+        """
+        :param process: 在fork出的子进程中处理请求, 否则在当前进程的线程中
+        """
+        if process:
+            self._process = multiprocessing.Process(target=self._serve_in_process, name='stub-pay-server')
+            self._process.daemon = True
+            self._process.start()
+        else:
+            self._thread = threading.Thread(target=self._server.serve_forever, name='stub-pay-server')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def _serve_in_process(self):
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def stop(self, timeout=5):
+        """ 停止服务, 并关闭仍保持着的keep-alive连接
+        """
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+        elif self._thread is not None:
+            self._server.shutdown()
+            self._server.close_connections(timeout)
+            self._thread = None
+        self._server.server_close()
+
+    def handle(self, path, params):
+        """ :return: (status_code, body)
+        """
+        delay = self.latency + (random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return 500, {'ret': False, 'code': 500, 'msg': 'injected error'}
+
+        path = path.strip('/')
+        if not path.startswith(self.root_path):
+            return 404, {'ret': False, 'code': 404, 'msg': 'not found'}
+        path = path[len(self.root_path):].lstrip('/')
+
+        for pattern, name in self.routes:
+            m = pattern.match(path)
+            if m:
+                data = {'ret': True, 'code': 0, 'msg': ''}
+                data.update(RESPONSES[name](params, m.groupdict()))
+                return 200, self._sign(data)
+        return 404, {'ret': False, 'code': 404, 'msg': 'not found'}
+
+    def _sign(self, data):
+        data['sign_type'] = SignType.RSA
+        data['sign'] = self.signer.sign(data, SignType.RSA)
+        return data
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # 默认的5在并发建立连接时会溢出, 客户端要等1秒重传SYN
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, handler_class)
+        # 正在处理的连接, keep-alive的连接在客户端关闭前会一直阻塞在读请求上
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self._connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self, timeout=5):
+        """ 关闭仍打开的连接, 并等待其处理线程结束
+        """
+        with self._connections_lock:
+            connections = list(self._connections)
+        for request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        deadline = time.time() + timeout
+        while self._connections and time.time() < deadline:
+            time.sleep(0.01)
+
+
+class _StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # 支持keep-alive
+    protocol_version = 'HTTP/1.1'
+    # 整个响应一次写出, 避免小包和Nagle算法带来的延迟
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        parts = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(parts.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(urlparse.parse_qsl(self.rfile.read(length)))
+
+        status_code, data = self.server.stub.handle(parts.path, params)
+        body = simplejson.dumps(data, use_decimal=True).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
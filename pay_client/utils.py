@@ -1,4 +1,6 @@
 # coding=utf-8
+from __future__ import unicode_literals
+
 from functools import wraps
 from ..util.log import get_logger
 
@@ -6,6 +8,23 @@ from ..util.log import get_logger
 logger = get_logger(__name__)
 
 
+class ApiUrl(unicode):
+    """ 记录了生成它的endpoint模板的url, 用于按endpoint应用请求策略
+    ApiUrl.of(template)(url)
+    """
+    template = None
+    _types = {}
+
+    @classmethod
+    def of(cls, template):
+        """ 模板对应的ApiUrl子类, 模板作为类属性, 构造时没有额外开销
+        """
+        url_type = cls._types.get(template)
+        if url_type is None:
+            url_type = cls._types[template] = type(str('ApiUrl'), (ApiUrl,), {'template': template})
+        return url_type
+
+
 def is_success_result(result):
     if result is None:
         return False
@@ -16,13 +35,101 @@ def is_success_result(result):
     return ret
 
 
+_FORM_HEAD = '<form id="formName" action="{0}" method="{1}">'
+_FORM_INPUT = '<input type="hidden" name="{0}" value="'
+_FORM_INPUT_END = '" />'
+_FORM_TAIL = '<input type="submit" value="Submit" style="display:none" /></form>' \
+             '<script>document.forms["formName"].submit();</script>'
+
+
+def _escape(value):
+    """ 同cgi.escape(value, quote=True), 大部分参数(sn, 金额, 签名)不含需转义的字符, 只做几次查找
+    """
+    if not isinstance(value, unicode):
+        value = value.decode('utf-8') if isinstance(value, str) else unicode(value)
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    return value
+
+
+def _escape_values(values):
+    """ 回调的参数值(sn, 结果, 签名)通常都是不需转义的文本, 先整体检查一次, 需要时才逐个转义
+    """
+    try:
+        joined = ''.join(values)
+    except (TypeError, UnicodeDecodeError):
+        # 有非文本或非ascii的bytes
+        return [_escape(value) for value in values]
+    if '&' in joined or '<' in joined or '>' in joined or '"' in joined:
+        return [_escape(value) for value in values]
+    return values
+
+
+# 回调表单的url和参数名是固定的几组, 按(url, method, 参数名)缓存渲染好的格式模板,
+# 每次只需转义参数值
+_templates = {}
+_MAX_TEMPLATES = 1024
+# 每段模板包含的参数个数, iter_submit_form逐段生成
+_CHUNK_FIELDS = 100
+
+
+def _escape_braces(text):
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def _form_templates(url, method, keys):
+    """ :return: 按_CHUNK_FIELDS个参数分段的格式模板列表, 连接后为整个表单
+    """
+    cache_key = (url, method, keys)
+    templates = _templates.get(cache_key)
+    if templates is None:
+        if len(_templates) >= _MAX_TEMPLATES:
+            _templates.clear()
+        templates = []
+        parts = [_escape_braces(_FORM_HEAD.format(_escape(url), _escape(method)))]
+        for i, key in enumerate(keys):
+            if i and i % _CHUNK_FIELDS == 0:
+                templates.append(''.join(parts))
+                parts = []
+            parts.append(_escape_braces(_FORM_INPUT.format(_escape(key))))
+            parts.append('{%d}' % (i % _CHUNK_FIELDS))
+            parts.append(_FORM_INPUT_END)
+        parts.append(_escape_braces(_FORM_TAIL))
+        templates.append(''.join(parts))
+        templates = _templates[cache_key] = tuple(templates)
+    return templates
+
+
+def _render(templates, values):
+    if len(templates) == 1:
+        yield templates[0].format(*values)
+        return
+    for i, template in enumerate(templates):
+        yield template.format(*values[i * _CHUNK_FIELDS:(i + 1) * _CHUNK_FIELDS])
+
+
 def submit_form(url, req_params, method='POST'):
-    submit_page = '<form id="formName" action="{0}" method="{1}">'.format(url, method)
-    for key in req_params:
-        submit_page += '''<input type="hidden" name="{0}" value='{1}' />'''.format(key, req_params[key])
-    submit_page += '<input type="submit" value="Submit" style="display:none" /></form>'
-    submit_page += '<script>document.forms["formName"].submit();</script>'
-    return submit_page
+    """ 生成自动提交的表单页, 参数值经过html转义
+    """
+    keys = tuple(req_params)
+    templates = _form_templates(url, method, keys)
+    values = _escape_values([req_params[key] for key in keys])
+    if len(templates) == 1:
+        return templates[0].format(*values)
+    return ''.join(_render(templates, values))
+
+
+def iter_submit_form(url, req_params, method='POST'):
+    """ 同submit_form, 每次生成_CHUNK_FIELDS个参数的一段, 可直接作为流式响应的body
+    """
+    keys = tuple(req_params)
+    return _render(_form_templates(url, method, keys), _escape_values([req_params[key] for key in keys]))
 
 
 def which_to_return(func):
@@ -0,0 +1,35 @@
+# coding=utf-8
+"""
+批量验签: 签名串在主进程中生成, RSA公钥验签(CPU密集, 且PyCrypto执行时持有GIL)分发到进程池
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+from ..util import public_key
+from ..util.sign import RSASignType, SignType, Signer
+
+# 发送到worker进程的验签任务, 只包含可以pickle的简单类型
+RSAVerifyTask = namedtuple('RSAVerifyTask', 'pub_key, src, signed, sign_type, urlsafe')
+
+
+def verify_rsa_task(task):
+    """ 在worker进程中执行, 需为模块级函数
+    :param task: RSAVerifyTask
+    """
+    try:
+        # worker进程内由public_key.registry按公钥缓存解析好的Key
+        key = public_key.loads_b64encoded_key(task.pub_key)
+        return bool(Signer._verify_rsa(task.src, key, task.signed, sign_type=task.sign_type, urlsafe=task.urlsafe))
+    except Exception:
+        return False
+
+
+def make_rsa_task(signer, data, rsa_sign_type=RSASignType.MD5, urlsafe=False):
+    """ 生成验签任务, 只适用于用对方公钥验签的RSA请求, 其它情况返回None
+    :param signer: _get_verify_signer得到的Signer
+    """
+    if data.get('sign_type') != SignType.RSA or data.get(signer.is_inner_key) or not signer.pub_key:
+        return None
+    return RSAVerifyTask(signer.pub_key, signer._gen_sign_data(data), data.get(signer.sign_key_name),
+                         rsa_sign_type, urlsafe)
@@ -1,67 +1,355 @@
 # coding=utf-8
 import json
 import base64
+import mmap
+import os
+from functools import partial
 from Crypto.Cipher import AES
+from Crypto.Util import Counter
 import digest
 
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+# 流式加解密每次处理的字节数, 为AES块长度16和base64编码单位3的公倍数, 各块的base64结果可以直接拼接
+CHUNK_SIZE = 48 * 4096
+# CHUNK_SIZE字节对应的base64长度
+B64_CHUNK_SIZE = CHUNK_SIZE // 3 * 4
+
+
+def _readable(data):
+    """ PyCrypto只接受str和只读buffer: bytearray包装为buffer, 不复制数据; py2的memoryview只能复制
+    """
+    if isinstance(data, bytearray):
+        return buffer(data)
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    return data
+
+
 def __pkcs7_padding(data, size=16):
     """补足被解密串到单位长度的位数
-    :param data: 被加密串
+    :param data: 被加密串, 为bytearray时原地补位
     :param size: 单位长度
     :return:
     """
     length = size - len(data) % size
+    if isinstance(data, bytearray):
+        data.extend(chr(length) * length)
+        return data
     return data + chr(length) * length
 
 
+def _padding_length(data, size=16):
+    """校验PKCS7 padding, 只检查末尾的padding字节
+    :return: padding长度, padding无效时返回None
+    """
+    if not data:
+        return None
+    length = ord(data[-1:])
+    if 0 < length <= size and data[-length:] == chr(length) * length:
+        return length
+    return None
+
+
 def __depkcs7_padding(data, size=16):
     """移除解密出的字符串的padding
+    padding有效时返回data上的buffer, 不复制数据; 否则按原来的方式移除最后一块中所有不大于size的字节
     :param data: 解密出的字符串
     :param size: 单位长度
     :return:
     """
-    newdata = data[:-size]
-    for c in data[-size:]:
-        if ord(c) > size:
-            newdata += c
-    return newdata
+    length = _padding_length(data, size)
+    if length is not None:
+        return buffer(data, 0, len(data) - length)
+    return bytes(data[:-size]) + b''.join([c for c in bytes(data[-size:]) if ord(c) > size])
+
+
+def _decode(data):
+    return unicode(data, 'utf8')
+
+
+def _encrypt_padded(cipher, data):
+    if not isinstance(data, bytearray):
+        data = _readable(data)
+    return cipher.encrypt(_readable(__pkcs7_padding(data)))
+
+
+def _decrypt_padded(cipher, data):
+    return __depkcs7_padding(cipher.decrypt(_readable(data)))
+
+
+def encrypt(data, key):
+    """ 加密bytes, bytearray或memoryview
+    为bytearray时原地补位, 不复制数据, 加密后data末尾会多出padding
+    """
+    return _encrypt_padded(AES.new(key[:16]), data)
+
+
+def decrypt(data, key):
+    """ 解密bytes, bytearray或memoryview, 返回去掉padding的bytes
+    """
+    return bytes(_decrypt_buffer(data, key))
+
 
-    # length = ord(data[-1])
-    # if length < size and data[-length:] == data[-1] * length:
-    #     # check是否为paddding
-    #     return data[:-length]
-    # return data
+def _decrypt_buffer(data, key):
+    # 返回去掉padding的buffer, 不复制数据, 只在内部直接解码时使用
+    return _decrypt_padded(AES.new(key[:16]), data)
 
 
 def encrypt_to_base64(data, key):
-    data = data.encode('utf8')
-    cipher = AES.new(key[:16])
-    return base64.b64encode(cipher.encrypt(__pkcs7_padding(data)))
+    return base64.b64encode(encrypt(data.encode('utf8'), key))
 
 
 def encrypt_to_urlsafe_base64(data, key):
-    data = data.encode('utf8')
-    cipher = AES.new(key[:16])
-    return base64.urlsafe_b64encode(cipher.encrypt(__pkcs7_padding(data)))
+    return base64.urlsafe_b64encode(encrypt(data.encode('utf8'), key))
 
 
 def decrypt_from_base64_with_mode(data, key, mode=AES.MODE_CBC, iv=None):
     cipher = AES.new(key[:16], mode, IV=iv)
-    return __depkcs7_padding(cipher.decrypt(base64.b64decode(data))).decode('utf8')
+    return _decode(__depkcs7_padding(cipher.decrypt(base64.b64decode(data))))
 
 
 def decrypt_from_base64(data, key):
-    cipher = AES.new(key[:16])
-    return __depkcs7_padding(cipher.decrypt(base64.b64decode(data))).decode('utf8')
+    return _decode(_decrypt_buffer(base64.b64decode(data), key))
 
 
 def decrypt_from_urlsafe_base64(data, key):
+    return _decode(_decrypt_buffer(base64.urlsafe_b64decode(data), key))
+
+
+class Mode:
+    ECB = 'ECB'
+    CBC = 'CBC'
+    CTR = 'CTR'
+    GCM = 'GCM'
+
+
+class UnsupportedModeError(Exception):
+    def __init__(self, mode):
+        message = "Unsupported aes mode [{0}].".format(mode)
+        super(UnsupportedModeError, self).__init__(message)
+
+
+def _has_gcm():
+    return hasattr(AES, 'MODE_GCM') or AESGCM is not None
+
+
+class AESCipher(object):
+    """ 绑定key的AES加解密, 一个对象可用于加解密多条消息
+    ECB: 与encrypt_to_base64相同, 复用同一个cipher对象
+    CBC: 随机iv + 密文, PKCS7补位
+    CTR: 随机8字节nonce + 密文, 不补位
+    GCM: 随机12字节nonce + 密文 + 16字节tag, 解密时校验tag, 需要PyCryptodome或cryptography
+    """
+    TAG_SIZE = 16
+
+    def __init__(self, key, mode=Mode.ECB):
+        self.key = key[:16]
+        self.mode = mode
+        self._ecb = None
+        self._aesgcm = None
+        if mode == Mode.ECB:
+            self._ecb = AES.new(self.key)
+        elif mode == Mode.GCM:
+            if not _has_gcm():
+                raise UnsupportedModeError(mode)
+            if not hasattr(AES, 'MODE_GCM'):
+                self._aesgcm = AESGCM(bytes(self.key))
+        elif mode not in (Mode.CBC, Mode.CTR):
+            raise UnsupportedModeError(mode)
+
+    def encrypt(self, data):
+        """
+        :param data: bytes, bytearray或memoryview
+        """
+        if self.mode == Mode.ECB:
+            return _encrypt_padded(self._ecb, data)
+        if self.mode == Mode.CBC:
+            iv = os.urandom(AES.block_size)
+            return iv + _encrypt_padded(AES.new(self.key, AES.MODE_CBC, iv), data)
+        if self.mode == Mode.CTR:
+            nonce = os.urandom(8)
+            cipher = AES.new(self.key, AES.MODE_CTR, counter=Counter.new(64, prefix=nonce))
+            return nonce + cipher.encrypt(_readable(data))
+        nonce = os.urandom(12)
+        if self._aesgcm is not None:
+            return nonce + self._aesgcm.encrypt(nonce, bytes(_readable(data)), None)
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(_readable(data))
+        return nonce + ciphertext + tag
+
+    def decrypt(self, data):
+        """ 返回bytes, GCM的tag不匹配时抛出ValueError
+        """
+        return bytes(self._decrypt(_readable(data)))
+
+    def _decrypt(self, data):
+        if self.mode == Mode.ECB:
+            return _decrypt_padded(self._ecb, data)
+        if self.mode == Mode.CBC:
+            iv = data[:AES.block_size]
+            return _decrypt_padded(AES.new(self.key, AES.MODE_CBC, iv), buffer(data, AES.block_size))
+        if self.mode == Mode.CTR:
+            cipher = AES.new(self.key, AES.MODE_CTR, counter=Counter.new(64, prefix=data[:8]))
+            return cipher.decrypt(buffer(data, 8))
+        nonce = data[:12]
+        if self._aesgcm is not None:
+            try:
+                return self._aesgcm.decrypt(nonce, bytes(data[12:]), None)
+            except InvalidTag:
+                raise ValueError('MAC check failed')
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        return cipher.decrypt_and_verify(data[12:-self.TAG_SIZE], data[-self.TAG_SIZE:])
+
+    def encrypt_to_base64(self, data, urlsafe=False):
+        """
+        :param data: unicode, 以utf8编码后加密
+        """
+        b64encode = base64.urlsafe_b64encode if urlsafe else base64.b64encode
+        return b64encode(self.encrypt(data.encode('utf8')))
+
+    def decrypt_from_base64(self, data, urlsafe=False):
+        b64decode = base64.urlsafe_b64decode if urlsafe else base64.b64decode
+        return _decode(self._decrypt(b64decode(data)))
+
+
+def _aligned_chunks(chunks, size):
+    """ 把任意长度的chunks重新切分为size整数倍的块, 返回(块, 是否为最后一块), 只有最后一块可能不足size
+    已对齐的块原样返回, 不会复制
+    """
+    pending = b''
+    aligned = None
+    for chunk in chunks:
+        if pending:
+            chunk = pending + bytes(chunk)
+        end = len(chunk) - len(chunk) % size
+        pending = chunk[end:] if end < len(chunk) else b''
+        if end:
+            if aligned is not None:
+                yield aligned, False
+            aligned = chunk if end == len(chunk) else chunk[:end]
+    if aligned is not None:
+        yield aligned, not pending
+    if pending or aligned is None:
+        yield pending, True
+
+
+def iter_file_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    """ 按chunk_size读取文件, 对mmap返回其上的buffer, 不复制数据
+    """
+    if isinstance(fileobj, mmap.mmap):
+        for offset in xrange(0, len(fileobj), chunk_size):
+            yield buffer(fileobj, offset, chunk_size)
+        return
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_encrypt(chunks, key):
+    """ 流式加密, 结果与一次加密全部数据相同
+    :param chunks: bytes的iterable, 如iter_file_chunks(f)
+    :return: 密文块的generator
+    """
+    cipher = AES.new(key[:16])
+    for chunk, is_last in _aligned_chunks(chunks, AES.block_size):
+        if not is_last:
+            yield cipher.encrypt(chunk)
+            continue
+        # 只在最后补位
+        end = len(chunk) - len(chunk) % AES.block_size
+        if end:
+            yield cipher.encrypt(chunk if end == len(chunk) else chunk[:end])
+        yield cipher.encrypt(__pkcs7_padding(chunk[end:]))
+
+
+def iter_decrypt(chunks, key):
+    """ 流式解密, 只在最后一块移除补位
+    :param chunks: 密文bytes的iterable
+    :return: 明文块的generator
+    """
     cipher = AES.new(key[:16])
-    return __depkcs7_padding(cipher.decrypt(base64.urlsafe_b64decode(data))).decode('utf8')
+    for chunk, is_last in _aligned_chunks(chunks, AES.block_size):
+        if not is_last:
+            yield cipher.decrypt(chunk)
+            continue
+        if len(chunk) % AES.block_size:
+            raise ValueError('Input strings must be a multiple of 16 in length')
+        data = cipher.decrypt(chunk)
+        yield data[:-AES.block_size]
+        yield bytes(__depkcs7_padding(data[-AES.block_size:]))
+
+
+def iter_encrypt_to_base64(chunks, key, urlsafe=False):
+    """ 同iter_encrypt, 逐块输出base64, 拼接后与encrypt_to_base64的结果相同
+    """
+    b64encode = base64.urlsafe_b64encode if urlsafe else base64.b64encode
+    for chunk, _ in _aligned_chunks(iter_encrypt(chunks, key), 3):
+        yield b64encode(chunk)
+
+
+def iter_decrypt_from_base64(chunks, key, urlsafe=False):
+    """ 同iter_decrypt, 输入为不含换行的base64
+    """
+    b64decode = base64.urlsafe_b64decode if urlsafe else base64.b64decode
+    return iter_decrypt((b64decode(chunk) for chunk, _ in _aligned_chunks(chunks, 4)), key)
+
+
+def encrypt_stream(fin, fout, key, use_base64=True, urlsafe=False, chunk_size=CHUNK_SIZE):
+    """ 从fin读取明文, 加密后写入fout, 内存中只保留一块
+    :param fin: 文件对象或mmap
+    """
+    chunks = iter_file_chunks(fin, chunk_size)
+    for chunk in iter_encrypt_to_base64(chunks, key, urlsafe) if use_base64 else iter_encrypt(chunks, key):
+        fout.write(chunk)
+
+
+def decrypt_stream(fin, fout, key, use_base64=True, urlsafe=False, chunk_size=None):
+    """ 从fin读取密文, 解密后写入fout
+    :param chunk_size: 每次读取的字节数, 默认为CHUNK_SIZE(输入为base64时为B64_CHUNK_SIZE)
+    """
+    if chunk_size is None:
+        chunk_size = B64_CHUNK_SIZE if use_base64 else CHUNK_SIZE
+    chunks = iter_file_chunks(fin, chunk_size)
+    for chunk in iter_decrypt_from_base64(chunks, key, urlsafe) if use_base64 else iter_decrypt(chunks, key):
+        fout.write(chunk)
+
+
+def _mapped(path):
+    """ 以mmap打开文件, 空文件不能mmap, 返回普通文件对象
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return open(path, 'rb')
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def encrypt_file(path, fout, key, use_base64=True, urlsafe=False, chunk_size=CHUNK_SIZE):
+    """ 加密文件, 以mmap读取, 不复制到进程内存
+    """
+    fin = _mapped(path)
+    try:
+        encrypt_stream(fin, fout, key, use_base64, urlsafe, chunk_size)
+    finally:
+        fin.close()
+
+
+def decrypt_file(path, fout, key, use_base64=True, urlsafe=False, chunk_size=None):
+    fin = _mapped(path)
+    try:
+        decrypt_stream(fin, fout, key, use_base64, urlsafe, chunk_size)
+    finally:
+        fin.close()
 
 
 def get_hmac(arr, key):
-    return digest.hmac_sign(''.join(arr), key)
+    return digest.HMAC(key).update_from(arr).hexdigest()
 
 
 def get_data_hmac(data, key):
@@ -72,35 +360,72 @@ def get_data_hmac(data, key):
     return get_hmac(string_array, key)
 
 
-def encrypt_data(data, key):
-    data_map = {k: v for k, v in data.items()}
+_json_encoder = json.JSONEncoder()
+_json_decoder = json.JSONDecoder()
 
-    # key_for_hmac = key
-    key_for_aes = key[:16]
+# 进程池worker中按(key, mode)复用的AESCipher
+_worker_ciphers = {}
+_MAX_WORKER_CIPHERS = 64
 
-    # hmac = get_data_hmac(data_map, key_for_hmac)
 
-    # data_map['hmac'] = hmac
-    data_json_string = json.dumps(data_map)
-    data = encrypt_to_base64(data_json_string, key_for_aes)
+def _worker_cipher(key, mode):
+    cipher = _worker_ciphers.get((key, mode))
+    if cipher is None:
+        if len(_worker_ciphers) >= _MAX_WORKER_CIPHERS:
+            _worker_ciphers.clear()
+        cipher = _worker_ciphers[(key, mode)] = AESCipher(key, mode)
+    return cipher
 
-    return data
 
+def _encrypt_record(cipher, data):
+    if not isinstance(data, dict):
+        data = dict(data.items())
+    return cipher.encrypt_to_base64(_json_encoder.encode(data))
 
-def decrypt_data(data, key):
-    # key_for_hmac = key
-    key_for_aes = key[:16]
 
+def _decrypt_record(cipher, data):
     try:
-        decrypted_data = decrypt_from_base64(data, key_for_aes)
-        result = json.loads(decrypted_data)
-
-        # hmac_ret = result['hmac']
-        # hmac = get_data_hmac(result, key_for_hmac)
+        return _json_decoder.decode(cipher.decrypt_from_base64(data))
     except Exception as e:
         raise ValueError("decrypt error: %s" % e.message)
 
-    # if hmac_ret != hmac:
-    #     raise ValueError("hmac mismatch.")
 
-    return result
+def _worker_encrypt_record(key, mode, data):
+    return _encrypt_record(_worker_cipher(key, mode), data)
+
+
+def _worker_decrypt_record(key, mode, data):
+    return _decrypt_record(_worker_cipher(key, mode), data)
+
+
+def encrypt_many(datas, key, mode=Mode.ECB, pool=None, chunksize=1000):
+    """ 批量加密, 每条结果与encrypt_data相同, 所有记录共用一个cipher和json encoder
+    :param datas: dict的iterable, 逐条读取
+    :param pool: multiprocessing.Pool, 传入时分发到进程池并发加密, 适用于大量记录
+    :param chunksize: 使用进程池时每次发给worker的记录数
+    :return: 与datas顺序一致的密文iterator
+    """
+    if pool is not None:
+        return pool.imap(partial(_worker_encrypt_record, key, mode), datas, chunksize)
+    cipher = AESCipher(key, mode)
+    return (_encrypt_record(cipher, data) for data in datas)
+
+
+def decrypt_many(datas, key, mode=Mode.ECB, pool=None, chunksize=1000):
+    """ encrypt_many的逆过程, 解密失败时在该条记录处抛出ValueError
+    """
+    if pool is not None:
+        return pool.imap(partial(_worker_decrypt_record, key, mode), datas, chunksize)
+    cipher = AESCipher(key, mode)
+    return (_decrypt_record(cipher, data) for data in datas)
+
+
+def encrypt_data(data, key, mode=Mode.ECB):
+    """
+    :param mode: 默认ECB与对方兼容; 使用Mode.GCM时密文带认证tag, 被篡改时decrypt_data会失败
+    """
+    return _encrypt_record(AESCipher(key, mode), data)
+
+
+def decrypt_data(data, key, mode=Mode.ECB):
+    return _decrypt_record(AESCipher(key, mode), data)
@@ -0,0 +1,154 @@
+# coding=utf-8
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# 区分"未命中"和"缓存了None"
+MISSING = object()
+
+
+class LRUCache(object):
+    """ 进程内线程安全的LRU缓存, 支持过期时间
+    """
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        :param max_size: 最大条目数, 超出时淘汰最久未使用的
+        :param ttl: 默认过期时间(秒), None表示不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                self._misses += 1
+                return default
+            value, expire_at = item
+            if expire_at is not None and expire_at <= time.time():
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data[key] = item
+            self._hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expire_at)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
+
+
+class SharedCache(object):
+    """ 基于外部存储(如redis)的多进程共享缓存
+    client需提供get(key), set(key, value, ex=None), delete(key), 与redis-py一致
+    值以json保存, 只支持json可表示的类型; 不用pickle, 以免能写入存储的人在读取的进程中执行代码
+    """
+    def __init__(self, client, prefix='', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _key(self, key):
+        return '{0}{1}'.format(self.prefix, key)
+
+    def get(self, key, default=None):
+        data = self.client.get(self._key(key))
+        value = MISSING
+        if data is not None:
+            try:
+                value = json.loads(data)
+            except ValueError:
+                # 不是此缓存写入的数据, 当作未命中
+                pass
+        with self._lock:
+            if value is MISSING:
+                self._misses += 1
+                return default
+            self._hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        ex = int(max(ttl, 1)) if ttl is not None else None
+        self.client.set(self._key(key), json.dumps(value), ex=ex)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': 0,
+                'expirations': 0,
+            }
+
+
+class LocalStore(object):
+    """ 进程内的SharedCache存储, 在没有redis时代替使用
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expire_at = item
+            if expire_at is not None and expire_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expire_at = time.time() + ex if ex is not None else None
+        with self._lock:
+            self._data[key] = (value, expire_at)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
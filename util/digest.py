@@ -1,6 +1,72 @@
 # coding=utf-8
 from __future__ import print_function, unicode_literals
 import hashlib
+import hmac
+from itertools import islice
+
+
+def _to_bytes(s, encode):
+    if isinstance(s, unicode):
+        return s.encode(encode)
+    return s
+
+
+class HMAC(object):
+    """
+    对报文采用md5进行hmac签名, 可多次update, 基于标准库hmac
+    h = HMAC(key); h.update(part1); h.update(part2); h.hexdigest()
+    """
+    def __init__(self, akey, avalue=None, encode="UTF-8"):
+        """
+        :param akey: 密钥
+        :param avalue: 初始报文
+        :param encode: unicode报文和密钥的编码方式
+        """
+        self.encode = encode
+        self._hmac = hmac.new(_to_bytes(akey, encode), digestmod=hashlib.md5)
+        if avalue is not None:
+            self.update(avalue)
+
+    def update(self, avalue):
+        self._hmac.update(_to_bytes(avalue, self.encode))
+
+    def update_from(self, values, batch_size=1024):
+        """ 逐段签名iterable中的报文, 每次只编码拼接batch_size段, 不需要先拼接全部
+        报文可以是unicode和bytes混合, unicode按encode编码
+        """
+        values = iter(values)
+        while True:
+            batch = list(islice(values, batch_size))
+            if not batch:
+                break
+            try:
+                # 通常都是unicode(或ascii的bytes), 整批拼接后编码
+                data = ''.join(batch).encode(self.encode)
+            except UnicodeDecodeError:
+                data = b''.join([_to_bytes(value, self.encode) for value in batch])
+            self._hmac.update(data)
+        return self
+
+    def update_from_file(self, fileobj, chunk_size=64 * 1024):
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            self.update(chunk)
+        return self
+
+    def copy(self):
+        """ 复制当前状态, 用同一密钥签名多个报文时不必重新处理密钥 """
+        other = HMAC.__new__(HMAC)
+        other.encode = self.encode
+        other._hmac = self._hmac.copy()
+        return other
+
+    def digest(self):
+        return self._hmac.digest()
+
+    def hexdigest(self):
+        return self._hmac.hexdigest()
 
 
 def hmac_sign(avalue, akey, encode="UTF-8"):
@@ -11,25 +77,18 @@ def hmac_sign(avalue, akey, encode="UTF-8"):
     :param encode: 字符串编码方式
     :return: 签名结果, hex字符
     """
-    keyb = akey.encode(encode)
-    value = avalue.encode(encode)
-
-    k_ipad = [chr(54)] * 64
-    k_opad = [chr(92)] * 64
-    for i, c in enumerate(keyb):
-        k_ipad[i] = chr(ord(c) ^ 0x36)
-        k_opad[i] = chr(ord(c) ^ 0x5c)
-    k_ipad = ''.join(k_ipad)
-    k_opad = ''.join(k_opad)
+    return HMAC(akey, avalue, encode).hexdigest()
 
-    md = hashlib.md5()
 
-    md.update(k_ipad)
-    md.update(value)
-    dg = md.digest()
-
-    md = hashlib.md5()
-    md.update(k_opad)
-    md.update(dg[:16])
-
-    return md.hexdigest()
+def hmac_sign_many(avalues, akey, encode="UTF-8"):
+    """
+    用同一密钥签名多个报文
+    :return: 与avalues顺序一致的签名结果列表
+    """
+    base = HMAC(akey, encode=encode)
+    signs = []
+    for avalue in avalues:
+        h = base.copy()
+        h.update(avalue)
+        signs.append(h.hexdigest())
+    return signs
@@ -1,23 +1,32 @@
 # coding=utf-8
 from Crypto import Random
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
-from Crypto.Hash import SHA, MD5, SHA256
-from Crypto.Cipher import PKCS1_OAEP
 import base64
+from hashlib import sha1
+from . import rsa_backends
+from .cache import LRUCache
 
 
 class Key(object):
     def __init__(self, rsa_key):
+        """
+        :param rsa_key: rsa_backends.RSABackend, 或PyCrypto的RSA key
+        """
+        if not isinstance(rsa_key, rsa_backends.RSABackend):
+            rsa_key = rsa_backends.PyCryptoRSA(rsa_key)
         self._key = rsa_key
-        self._signer = PKCS1_v1_5.new(self._key)
-        self._cipher = PKCS1_OAEP.new(self._key, hashAlgo=SHA256)
+        self._public_key = None
+
+    @property
+    def backend(self):
+        return self._key.name
 
     def gen_public_key(self):
         """如果此含私钥，则生成相应的公钥
         """
         if self.has_private():
-            return Key(self._key.publickey())
+            if self._public_key is None:
+                self._public_key = Key(self._key.public_key())
+            return self._public_key
 
     def has_private(self):
         """是否含私钥
@@ -30,7 +39,7 @@ class Key(object):
         否则返回公钥内容
         :return:
         """
-        return self._key.exportKey(format, pkcs=pkcs)
+        return self._key.export(format, pkcs=pkcs)
 
     def b64encoded_binary_key_data(self):
         """对于private key生成PKCS#8 DER SEQUENCE
@@ -46,10 +55,7 @@ class Key(object):
         fout.write(self.key_data())
 
     def sign_sha(self, data):
-        h = SHA.new()
-        h.update(data)
-
-        return self._signer.sign(h)
+        return self._key.sign(data, 'SHA')
 
     def sign_sha_to_base64(self, data, urlsafe=False):
         if urlsafe:
@@ -57,10 +63,7 @@ class Key(object):
         return base64.b64encode(self.sign_sha(data))
 
     def verify_sha(self, data, signature):
-        h = SHA.new()
-        h.update(data)
-
-        return self._signer.verify(h, signature)
+        return self._key.verify(data, signature, 'SHA')
 
     def verify_sha_from_base64(self, data, signature, urlsafe=False):
         if urlsafe:
@@ -69,10 +72,7 @@ class Key(object):
 
     def sign_md5(self, data):
         """对数据先进行md5 hash，再用私钥签名"""
-        h = MD5.new()
-        h.update(data)
-
-        return self._signer.sign(h)
+        return self._key.sign(data, 'MD5')
 
     def sign_md5_to_base64(self, data, urlsafe=False):
         """对数据先进行md5 hash，再用私钥签名, 并用base64编码结果"""
@@ -82,10 +82,7 @@ class Key(object):
 
     def verify_md5(self, data, signature):
         """用公钥验签"""
-        h = MD5.new()
-        h.update(data)
-
-        return self._signer.verify(h, signature)
+        return self._key.verify(data, signature, 'MD5')
 
     def verify_md5_from_base64(self, data, signature, urlsafe=False):
         """用公钥验签进base64编码的签名"""
@@ -95,7 +92,7 @@ class Key(object):
 
     def encrypt(self, data):
         """使用公钥加密数据"""
-        return self._cipher.encrypt(data)
+        return self._key.encrypt(data)
 
     def encrypt_to_base64(self, data):
         """使用公钥加密数据并用base64编码结果"""
@@ -103,30 +100,96 @@ class Key(object):
 
     def decrypt(self, ciphertext):
         """使用私钥解密密文"""
-        return self._cipher.decrypt(ciphertext)
+        return self._key.decrypt(ciphertext)
 
     def decrypt_from_base64(self, ciphertext):
         """使用私钥解密经base64编码的密文"""
-        return self._cipher.decrypt(base64.b64decode(ciphertext))
+        return self._key.decrypt(base64.b64decode(ciphertext))
+
+
+def atfork():
+    """fork出的子进程(如进程池的worker)在用key签名或加密前需重新初始化随机数生成器
+    """
+    Random.atfork()
+
+
+def generate_key(bits=2048, backend=None):
+    """
+    :param backend: rsa_backends中的实现名, 默认为rsa_backends.DEFAULT_BACKEND
+    """
+    return Key(rsa_backends.get_backend(backend).generate(bits))
+
+
+def load_key(key_path, backend=None):
+    return loads_key(open(key_path).read(), backend)
+
+
+class KeyRegistry(object):
+    """ 进程内按指纹缓存解析好的Key, Key是不可变的, 可以共用
+    相同的key只解析一次, 其生成的公钥和签名/加密对象也随Key一起复用
+    """
+    def __init__(self, max_size=256):
+        self._keys = LRUCache(max_size)
+
+    def loads_key(self, key_data, backend=None):
+        return self._get_or_load(key_data, backend, _loads_key)
+
+    def loads_b64encoded_key(self, encoded_key_data, backend=None):
+        return self._get_or_load(encoded_key_data, backend, _loads_b64encoded_key)
+
+    def _get_or_load(self, data, backend, load):
+        backend = rsa_backends.get_backend(backend)
+        fingerprint = (backend.name, fingerprint_of(data))
+        key = self._keys.get(fingerprint)
+        if key is None:
+            key = load(data, backend)
+            self._keys.set(fingerprint, key)
+        return key
+
+    def discard(self, key_data):
+        """ 移除不再使用的key(如已释放渠道的私钥), 不再由缓存持有; key_data为loads时的原始数据
+        """
+        fingerprint = fingerprint_of(key_data)
+        for name in rsa_backends.BACKENDS:
+            self._keys.delete((name, fingerprint))
+
+    def clear(self):
+        self._keys.clear()
+
+    def stats(self):
+        return self._keys.stats()
+
+
+def fingerprint_of(key_data):
+    if isinstance(key_data, unicode):
+        key_data = key_data.encode('utf-8')
+    return sha1(key_data).hexdigest()
+
 
+registry = KeyRegistry()
 
-def generate_key(bits=2048):
-    rng = Random.new().read
 
-    return Key(RSA.generate(bits, rng))
+def loads_key(key_data, backend=None):
+    return registry.loads_key(key_data, backend)
 
 
-def load_key(key_path):
-    return Key(RSA.importKey(open(key_path).read()))
+def _loads_key(key_data, backend):
+    try:
+        return Key(backend.loads(key_data))
+    except (ValueError, TypeError):
+        if backend is rsa_backends.PyCryptoRSA:
+            raise
+        # 如OpenSSH格式的公钥, 只有PyCrypto支持
+        return Key(rsa_backends.PyCryptoRSA.loads(key_data))
 
 
-def loads_key(key_data):
-    return Key(RSA.importKey(key_data))
+def load_b64encoded_key(key_path, backend=None):
+    return loads_b64encoded_key(open(key_path).read(), backend)
 
 
-def load_b64encoded_key(key_path):
-    return Key(RSA.importKey(base64.b64decode(open(key_path).read())))
+def loads_b64encoded_key(encoded_key_data, backend=None):
+    return registry.loads_b64encoded_key(encoded_key_data, backend)
 
 
-def loads_b64encoded_key(encoded_key_data):
-    return loads_key(base64.b64decode(encoded_key_data))
+def _loads_b64encoded_key(encoded_key_data, backend):
+    return _loads_key(base64.b64decode(encoded_key_data), backend)
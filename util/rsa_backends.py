@@ -0,0 +1,203 @@
+# coding=utf-8
+"""
+public_key.Key的RSA实现
+安装了cryptography时默认使用基于OpenSSL的实现, 否则使用PyCrypto;
+PKCS#1 v1.5签名是确定的, 两种实现结果完全相同; OAEP(SHA256)加密带随机数, 两种实现可互相解密
+"""
+from Crypto import Random
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.Hash import MD5, SHA, SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+try:
+    from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except ImportError:
+    default_backend = None
+
+
+class UnknownBackendError(Exception):
+    def __init__(self, name):
+        message = "Unknown rsa backend [{0}].".format(name)
+        super(UnknownBackendError, self).__init__(message)
+
+
+class RSABackend(object):
+    """ 一个RSA key的实现, hash_name为'SHA'或'MD5'
+    """
+    name = None
+
+    @classmethod
+    def loads(cls, key_data):
+        raise NotImplementedError
+
+    @classmethod
+    def generate(cls, bits):
+        raise NotImplementedError
+
+    def has_private(self):
+        raise NotImplementedError
+
+    def public_key(self):
+        raise NotImplementedError
+
+    def export(self, format='PEM', pkcs=1):
+        raise NotImplementedError
+
+    def sign(self, data, hash_name):
+        raise NotImplementedError
+
+    def verify(self, data, signature, hash_name):
+        raise NotImplementedError
+
+    def encrypt(self, data):
+        raise NotImplementedError
+
+    def decrypt(self, ciphertext):
+        raise NotImplementedError
+
+
+class PyCryptoRSA(RSABackend):
+    name = 'pycrypto'
+    _hashes = {'SHA': SHA, 'MD5': MD5}
+
+    def __init__(self, rsa_key):
+        self.rsa_key = rsa_key
+        self._signer = PKCS1_v1_5.new(rsa_key)
+        self._cipher = PKCS1_OAEP.new(rsa_key, hashAlgo=SHA256)
+
+    @classmethod
+    def loads(cls, key_data):
+        return cls(RSA.importKey(key_data))
+
+    @classmethod
+    def generate(cls, bits):
+        return cls(RSA.generate(bits, Random.new().read))
+
+    def has_private(self):
+        return self.rsa_key.has_private()
+
+    def public_key(self):
+        return PyCryptoRSA(self.rsa_key.publickey())
+
+    def export(self, format='PEM', pkcs=1):
+        return self.rsa_key.exportKey(format, pkcs=pkcs)
+
+    def sign(self, data, hash_name):
+        return self._signer.sign(self._hashes[hash_name].new(data))
+
+    def verify(self, data, signature, hash_name):
+        return self._signer.verify(self._hashes[hash_name].new(data), signature)
+
+    def encrypt(self, data):
+        return self._cipher.encrypt(data)
+
+    def decrypt(self, ciphertext):
+        return self._cipher.decrypt(ciphertext)
+
+
+class OpenSSLRSA(RSABackend):
+    """ 基于cryptography(OpenSSL)的实现, 签名和解密比PyCrypto快一个数量级
+    """
+    name = 'openssl'
+
+    def __init__(self, key):
+        self.key = key
+        self._is_private = isinstance(key, rsa.RSAPrivateKey)
+        self._public = key.public_key() if self._is_private else key
+        self._hashes = {'SHA': hashes.SHA1(), 'MD5': hashes.MD5()}
+        self._oaep = padding.OAEP(mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+    @classmethod
+    def loads(cls, key_data):
+        """ 支持PEM和DER格式的私钥(PKCS#1, PKCS#8)和公钥, 与RSA.importKey一样接受unicode的PEM文本
+        """
+        if isinstance(key_data, unicode):
+            key_data = key_data.encode('ascii')
+        backend = default_backend()
+        if key_data.startswith(b'-----'):
+            loaders = (lambda d: serialization.load_pem_private_key(d, None, backend),
+                       lambda d: serialization.load_pem_public_key(d, backend))
+        else:
+            loaders = (lambda d: serialization.load_der_private_key(d, None, backend),
+                       lambda d: serialization.load_der_public_key(d, backend))
+        for load in loaders:
+            try:
+                return cls(load(key_data))
+            except (ValueError, UnsupportedAlgorithm):
+                pass
+        raise ValueError('RSA key format is not supported')
+
+    @classmethod
+    def generate(cls, bits):
+        return cls(rsa.generate_private_key(65537, bits, default_backend()))
+
+    def has_private(self):
+        return self._is_private
+
+    def public_key(self):
+        return OpenSSLRSA(self._public)
+
+    def export(self, format='PEM', pkcs=1):
+        if format == 'OpenSSH':
+            # 与PyCrypto一致, 私钥也只导出其公钥
+            return self._public.public_bytes(serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH)
+        if format == 'PEM':
+            encoding = serialization.Encoding.PEM
+        elif format == 'DER':
+            encoding = serialization.Encoding.DER
+        else:
+            raise ValueError("Unknown key format '{0}'".format(format))
+
+        if self._is_private:
+            private_format = serialization.PrivateFormat.PKCS8 if pkcs == 8 \
+                else serialization.PrivateFormat.TraditionalOpenSSL
+            data = self.key.private_bytes(encoding, private_format, serialization.NoEncryption())
+        else:
+            # 与PyCrypto一致, 公钥总是导出为X.509 SubjectPublicKeyInfo
+            data = self.key.public_bytes(encoding, serialization.PublicFormat.SubjectPublicKeyInfo)
+        # PyCrypto导出的PEM末尾没有换行
+        return data.rstrip(b'\n') if format == 'PEM' else data
+
+    def sign(self, data, hash_name):
+        return self.key.sign(data, padding.PKCS1v15(), self._hashes[hash_name])
+
+    def verify(self, data, signature, hash_name):
+        try:
+            self._public.verify(signature, data, padding.PKCS1v15(), self._hashes[hash_name])
+            return True
+        except InvalidSignature:
+            return False
+
+    def encrypt(self, data):
+        return self._public.encrypt(data, self._oaep)
+
+    def decrypt(self, ciphertext):
+        return self.key.decrypt(ciphertext, self._oaep)
+
+
+BACKENDS = {PyCryptoRSA.name: PyCryptoRSA}
+if default_backend is not None:
+    BACKENDS[OpenSSLRSA.name] = OpenSSLRSA
+
+DEFAULT_BACKEND = OpenSSLRSA.name if OpenSSLRSA.name in BACKENDS else PyCryptoRSA.name
+
+
+def get_backend(name=None):
+    """
+    :param name: 'openssl'或'pycrypto', 默认为DEFAULT_BACKEND
+    """
+    name = name or DEFAULT_BACKEND
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise UnknownBackendError(name)
+    return backend
+
+
+def set_default_backend(name):
+    global DEFAULT_BACKEND
+    get_backend(name)
+    DEFAULT_BACKEND = name
@@ -1,7 +1,12 @@
 # coding=utf-8
 from __future__ import unicode_literals
-from hashlib import md5
+import threading
+from collections import namedtuple
+from hashlib import md5, sha1
+from multiprocessing import Pool
+from timeit import default_timer as timer
 from . import public_key
+from .cache import LRUCache
 
 
 class UnknownSignTypeError(Exception):
@@ -20,10 +25,163 @@ class RSASignType:
     MD5 = 'MD5'
 
 
+class SignCache(object):
+    """ RSA签名缓存
+    PKCS#1 v1.5签名是确定的, 相同的key和签名串总是得到相同的签名, 重复的请求不必再做私钥运算
+    """
+    def __init__(self, max_size=1024, ttl=None):
+        self._cache = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._rsa_signs = 0
+        self._rsa_seconds = 0.0
+
+    def get_or_sign(self, key, sign_func, *args, **kwargs):
+        signed = self._cache.get(key)
+        if signed is None:
+            start = timer()
+            signed = sign_func(*args, **kwargs)
+            elapsed = timer() - start
+            with self._lock:
+                self._rsa_signs += 1
+                self._rsa_seconds += elapsed
+            self._cache.set(key, signed)
+        return signed
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            avg_seconds = self._rsa_seconds / self._rsa_signs if self._rsa_signs else 0
+            stats.update({
+                'rsa_signs': self._rsa_signs,
+                'rsa_seconds': self._rsa_seconds,
+                # 按平均签名耗时估算缓存命中节省的时间
+                'rsa_seconds_saved': avg_seconds * stats['hits'],
+            })
+        return stats
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+class Canonicalizer(object):
+    """ 按Signer的设置生成签名串: 参与签名的参数按名称排序后以 k=v&k=v 连接
+    参数名的过滤和排序结果按参数名集合缓存, 同一种请求的参数集合是固定的, 之后每次只需线性扫描
+    """
+    def __init__(self, ignore_keys=(), include_keys=(), ignore_case=True, schema_cache_size=1024):
+        self.ignore_keys = frozenset(ignore_keys)
+        self.include_keys = frozenset(include_keys)
+        self.ignore_case = ignore_case
+        # 参数名集合 => 排好序的参与签名的参数名
+        self._schemas = LRUCache(schema_cache_size)
+
+    def _is_signed_key(self, k):
+        return k and k not in self.ignore_keys and (k in self.include_keys or k[0] != '_')
+
+    def _sort_key(self, k):
+        # 忽略大小写时仍以原参数名排在后面, 保证相同的参数集合总是得到相同的顺序
+        k = _text(k)
+        if self.ignore_case:
+            return k.lower(), k
+        return k
+
+    def sorted_keys(self, data):
+        """
+        :return: 排好序的参与签名的参数名和其在签名串中的前缀: ((k, 'k='), ...)
+        """
+        schema = frozenset(data)
+        keys = self._schemas.get(schema)
+        if keys is None:
+            keys = tuple((k, '%s=' % _text(k))
+                         for k in sorted([k for k in schema if self._is_signed_key(k)], key=self._sort_key))
+            self._schemas.set(schema, keys)
+        return keys
+
+    def canonicalize(self, data):
+        """
+        :param data: dict, 参数名和值可以是unicode或utf-8编码的bytes
+        :return: unicode签名串
+        """
+        values = []
+        for k, prefix in self.sorted_keys(data):
+            v = data[k]
+            # 过滤掉空值，list和dict类型
+            if isinstance(v, unicode):
+                if v:
+                    values.append(prefix + v)
+            elif isinstance(v, bytes):
+                if v:
+                    values.append(prefix + v.decode('utf-8'))
+            elif v is not None and not isinstance(v, (dict, list)):
+                values.append('%s%s' % (prefix, v))
+        return '&'.join(values)
+
+
+# sign_many/verify_many每一项的结果, 出错时value为None, error为异常
+SignResult = namedtuple('SignResult', 'value, error')
+# 不传pool时, RSA任务少于此数直接在当前进程执行, 不值得临时启动进程池
+RSA_MIN_PARALLEL = 32
+
+
+class _RSAKeys(object):
+    """ 签名和验签用到的key, 在进程池的每个worker中只加载一次
+    """
+    def __init__(self, pri_key_obj=None, pub_key_obj=None):
+        self.pri_key = pri_key_obj
+        self.pub_key = pub_key_obj
+        # is_inner的请求用私钥对应的公钥验签
+        self.inner_pub_key = pri_key_obj.gen_public_key() if pri_key_obj else None
+
+
+_worker_keys = None
+
+
+def _init_rsa_worker(pri_key, pub_key):
+    global _worker_keys
+    public_key.atfork()
+    _worker_keys = _RSAKeys(public_key.loads_b64encoded_key(pri_key) if pri_key else None,
+                            public_key.loads_b64encoded_key(pub_key) if pub_key else None)
+
+
+def _sign_rsa_item(keys, task):
+    src, sign_type, urlsafe = task
+    try:
+        return SignResult(Signer._sign_rsa(src, keys.pri_key, sign_type=sign_type, urlsafe=urlsafe), None)
+    except Exception as e:
+        return SignResult(None, e)
+
+
+def _verify_rsa_item(keys, task):
+    src, signed, is_inner, sign_type, urlsafe = task
+    try:
+        key = keys.inner_pub_key if is_inner else keys.pub_key
+        return SignResult(Signer._verify_rsa(src, key, signed, sign_type=sign_type, urlsafe=urlsafe), None)
+    except Exception as e:
+        return SignResult(None, e)
+
+
+def _worker_sign_rsa(task):
+    return _sign_rsa_item(_worker_keys, task)
+
+
+def _worker_verify_rsa(task):
+    return _verify_rsa_item(_worker_keys, task)
+
+
+def _key_id(key):
+    if not key:
+        return None
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return sha1(key).hexdigest()
+
+
 class Signer(object):
     def __init__(self, md5_key_param_name='key', sign_key_name='sign', md5_key=None, pri_key=None, pub_key=None,
                  is_inner_key='_is_inner', ignore_case=True, use_uppercase=False,
-                 ignore_keys=set(), include_keys=set()):
+                 ignore_keys=set(), include_keys=set(), sign_cache=None):
         """
         :param md5_key_param_name: md5_key本身是要参与签名的，此为生成原始字符串时其参数名
         :param sign_key_name: 签名参数名
@@ -33,31 +191,118 @@ class Signer(object):
         :param is_inner_key: is_inner表示是否为相同的私钥签名的，is_inner_key为此值的参数名
         :param ignore_case: 在生成签名串时是否忽略大小写
         :param use_uppercase: md5最后的sign是否转化成大写
+        :param sign_cache: SignCache, 缓存RSA签名
         :return:
         """
         self.md5_key_param_name = md5_key_param_name
         self.sign_key_name = sign_key_name
         self.md5_key = md5_key
         self.pri_key = pri_key
+        self.pri_key_id = _key_id(pri_key)
         self.pri_key_obj = public_key.loads_b64encoded_key(pri_key) if pri_key else None
         self.pub_key = pub_key
         self.pub_key_obj = public_key.loads_b64encoded_key(pub_key) if pub_key else None
 
         self.is_inner_key = is_inner_key
-        self.ignore_case = ignore_case
         self.use_uppercase = use_uppercase
-        self.ignore_keys = set(ignore_keys)
-        self.ignore_keys.add(self.sign_key_name)
+        self.sign_cache = sign_cache
+        self.canonicalizer = Canonicalizer(set(ignore_keys) | {self.sign_key_name}, include_keys, ignore_case)
+
+    # 签名串的设置保存在canonicalizer中(frozenset, 不能原地修改), 重新赋值时重建canonicalizer
+    @property
+    def ignore_keys(self):
+        return self.canonicalizer.ignore_keys
 
-        self.include_keys = set(include_keys)
+    @ignore_keys.setter
+    def ignore_keys(self, ignore_keys):
+        self.canonicalizer = Canonicalizer(ignore_keys, self.include_keys, self.ignore_case)
+
+    @property
+    def include_keys(self):
+        return self.canonicalizer.include_keys
+
+    @include_keys.setter
+    def include_keys(self, include_keys):
+        self.canonicalizer = Canonicalizer(self.ignore_keys, include_keys, self.ignore_case)
+
+    @property
+    def ignore_case(self):
+        return self.canonicalizer.ignore_case
+
+    @ignore_case.setter
+    def ignore_case(self, ignore_case):
+        self.canonicalizer = Canonicalizer(self.ignore_keys, self.include_keys, ignore_case)
 
     def init(self, md5_key=None, pri_key=None, pub_key=None):
         self.md5_key = md5_key
         self.pri_key = pri_key
+        self.pri_key_id = _key_id(pri_key)
         self.pri_key_obj = public_key.loads_b64encoded_key(pri_key) if pri_key else None
         self.pub_key = pub_key
         self.pub_key_obj = public_key.loads_b64encoded_key(pub_key) if pub_key else None
 
+    def process_pool(self, processes=None):
+        """ 创建用于sign_many/verify_many的进程池, 每个worker只加载一次key
+        可在多次调用间复用, 用完后需close
+        """
+        return Pool(processes, _init_rsa_worker, (self.pri_key, self.pub_key))
+
+    def sign_many(self, datas, sign_type, rsa_sign_type=RSASignType.MD5, urlsafe=False, pool=None):
+        """ 批量签名, 签名串在当前进程生成, RSA签名在进程池中执行
+        :param datas: 请求参数的iterable
+        :param pool: process_pool()创建的进程池, 不传则任务不少于RSA_MIN_PARALLEL时临时创建一个
+        :return: 与datas顺序一致的[SignResult(value, error), ...]
+        """
+        if sign_type != SignType.RSA:
+            return [self._call(self.sign, data, sign_type) for data in datas]
+        return self._run_rsa_tasks(_sign_rsa_item, _worker_sign_rsa, datas, pool,
+                                   lambda data: (self._gen_sign_data(data), rsa_sign_type, urlsafe))
+
+    def verify_many(self, datas, sign_type, rsa_sign_type=RSASignType.MD5, urlsafe=False, pool=None):
+        """ 批量验签, 同sign_many
+        :return: 与datas顺序一致的[SignResult(is_verify_pass, error), ...]
+        """
+        if sign_type != SignType.RSA:
+            return [self._call(self.verify, data, sign_type) for data in datas]
+        return self._run_rsa_tasks(_verify_rsa_item, _worker_verify_rsa, datas, pool,
+                                   lambda data: (self._gen_sign_data(data), data.get(self.sign_key_name),
+                                                 bool(data.get(self.is_inner_key)), rsa_sign_type, urlsafe))
+
+    @staticmethod
+    def _call(func, *args):
+        try:
+            return SignResult(func(*args), None)
+        except Exception as e:
+            return SignResult(None, e)
+
+    def _run_rsa_tasks(self, item_func, worker_func, datas, pool, make_task):
+        datas = list(datas)
+        results = [None] * len(datas)
+        indexes, tasks = [], []
+        for i, data in enumerate(datas):
+            try:
+                tasks.append(make_task(data))
+                indexes.append(i)
+            except Exception as e:
+                results[i] = SignResult(None, e)
+
+        if pool is None and len(tasks) < RSA_MIN_PARALLEL:
+            keys = _RSAKeys(self.pri_key_obj, self.pub_key_obj)
+            task_results = [item_func(keys, task) for task in tasks]
+        elif pool is not None:
+            task_results = pool.map(worker_func, tasks)
+        else:
+            pool = self.process_pool()
+            try:
+                task_results = pool.map(worker_func, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        for i, result in zip(indexes, task_results):
+            results[i] = result
+        return results
+
     def md5_sign(self, data):
         return self._sign_md5_data(data)
 
@@ -94,6 +339,10 @@ class Signer(object):
     def _sign_rsa_data(self, data, sign_type=RSASignType.MD5, urlsafe=False):
         src = self._gen_sign_data(data)
 
+        if self.sign_cache is not None:
+            key = (self.pri_key_id, sign_type, urlsafe, src)
+            return self.sign_cache.get_or_sign(key, self._sign_rsa, src, self.pri_key_obj,
+                                               sign_type=sign_type, urlsafe=urlsafe)
         return self._sign_rsa(src, self.pri_key_obj, sign_type=sign_type, urlsafe=urlsafe)
 
     def _verify_rsa_data(self, data, sign_type=RSASignType.MD5, urlsafe=False):
@@ -106,21 +355,8 @@ class Signer(object):
         # 只要is_inner_key传了，且不为空
         return self._verify_rsa(src, self.pri_key_obj.gen_public_key(), signed, sign_type=sign_type, urlsafe=urlsafe)
 
-    def _is_valid_item(self, k, v):
-        return k and k not in self.ignore_keys and (k in self.include_keys or k[0] != '_') \
-               and v is not None and v != '' and not isinstance(v, (dict, list))
-
     def _gen_sign_data(self, data):
-        keys = data.keys()
-        if self.ignore_case:
-            keys.sort(key=lambda x: x.lower())
-        else:
-            keys.sort()
-
-        # 过滤掉空值，list和dict类型
-        values = ['%s=%s' % (k, data[k]) for k in keys if self._is_valid_item(k, data[k])]
-
-        return '&'.join(values)
+        return self.canonicalizer.canonicalize(data)
 
     def _sign_md5(self, src, key, key_param_name):
         if key_param_name is None: